@@ -0,0 +1,235 @@
+import sys
+import os
+import json
+import time
+import random
+import struct
+import asyncio
+import argparse
+import platform
+import tracemalloc
+from lzw_compressor import LZWCompressor, TRIE_TYPES
+from lzw_decompressor import LZWDecompressor
+from lzw_async import LZWAsyncService
+
+# Benchmark harness: compresses and decompresses local corpora with every
+# selected trie backend and max_bits, repeating each measurement, and writes the
+# results as JSON so runs of different versions can be compared (--compare).
+#
+#   python bench.py --corpus text random --sizes 1M 16M --trie standard flat --output bench.json
+#   python bench.py --file book.txt --compare bench.json
+#   python bench.py --corpus text --entropy    # also with the entropy-coding stage
+
+CORPORA = ('text', 'binary', 'random', 'repetitive')
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+def parse_size(text):
+    """Parse a size such as 4096, 64K or 100M into a number of bytes."""
+    text = text.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+def generate_corpus(kind, size, seed=0):
+    """Generate size bytes of a synthetic corpus, the same for a given seed."""
+    rng = random.Random(seed)
+    if kind == 'text':
+        # Words with a Zipf-like frequency distribution, twelve to a line
+        letters = 'etaoinshrdlcumwfgypbvkjxqz'
+        vocabulary = [''.join(rng.choices(letters, k=rng.randint(1, 10))) for _ in range(5000)]
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        data = bytearray()
+        while len(data) < size:
+            words = rng.choices(vocabulary, weights, k=12000)
+            data += '\n'.join(' '.join(words[i:i + 12]) for i in range(0, len(words), 12)).encode('ascii') + b'\n'
+        return bytes(data[:size])
+    if kind == 'binary':
+        # Fixed-size records of a counter and a few small fields, like a log or table dump
+        data = bytearray()
+        record = struct.Struct('<IHhH')
+        counter = rng.randrange(1 << 20)
+        while len(data) < size:
+            counter += rng.randint(1, 3)
+            data += record.pack(counter, rng.randrange(64), rng.randint(-100, 100), rng.choice((200, 200, 200, 304, 404, 500)))
+        return bytes(data[:size])
+    if kind == 'random':
+        return rng.randbytes(size)
+    if kind == 'repetitive':
+        # A short pattern repeated over and over, with a rare changed byte
+        pattern = bytearray(rng.randbytes(rng.randint(16, 64)))
+        data = bytearray()
+        while len(data) < size:
+            pattern[rng.randrange(len(pattern))] = rng.randrange(256)
+            data += pattern * 1000
+        return bytes(data[:size])
+    raise ValueError(f"Unknown corpus: {kind} (expected one of {', '.join(CORPORA)})")
+
+def synthetic_inputs(kind, sizes, seed):
+    # Generated one size at a time, so only one input is held in memory
+    for size in sizes:
+        yield generate_corpus(kind, size, seed)
+
+def percentile(sorted_values, fraction):
+    """Linearly interpolated percentile of an already sorted list."""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(times_ns, size):
+    times_ns = sorted(times_ns)
+    median = percentile(times_ns, 0.5)
+    return {
+        'trials': len(times_ns),
+        'min_ns': times_ns[0],
+        'mean_ns': sum(times_ns) / len(times_ns),
+        'p50_ns': median,
+        'p90_ns': percentile(times_ns, 0.9),
+        'p99_ns': percentile(times_ns, 0.99),
+        'max_ns': times_ns[-1],
+        'ns_per_byte': median / size if size else 0,
+        'mb_per_s': size / (1 << 20) / (median / 1e9) if median else 0
+    }
+
+def measure(function, warmup, repeat):
+    """Run function warmup times untimed, then repeat times timed; returns the times in ns."""
+    for _ in range(warmup):
+        function()
+    times_ns = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        times_ns.append(time.perf_counter_ns() - start)
+    return times_ns
+
+def peak_memory(function):
+    """Peak Python heap allocated while function runs, traced separately from the timed trials."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def max_rss():
+    # Peak resident set size of the whole process so far (not available on Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # bytes on macOS, KiB elsewhere
+
+def bench_one(corpus, data, trie, max_bits, warmup, repeat, trace_memory, entropy=False):
+    # A new compressor is built for every run, outside the timed region
+    compress = lambda: LZWCompressor(max_bits=max_bits, trie=trie, entropy=entropy).compress(data, packed=True)
+    compressed_data = compress()
+    decompress = lambda: LZWDecompressor().decompress(compressed_data, packed=True)
+    if decompress() != data:
+        raise ValueError(f"Round trip failed for {corpus} with the {trie} trie and max_bits={max_bits}")
+    # The streaming decoder of the async service must give back the same bytes
+    if asyncio.run(LZWAsyncService().decompress(compressed_data)) != data:
+        raise ValueError(f"Async round trip failed for {corpus} with the {trie} trie and max_bits={max_bits}")
+
+    results = []
+    for operation, function in (('compression', compress), ('decompression', decompress)):
+        result = {
+            'corpus': corpus,
+            'size': len(data),
+            'trie_type': trie,
+            'max_bits': max_bits,
+            'entropy': entropy,
+            'operation': operation,
+            'ratio': len(compressed_data) / len(data) if data else 0
+        }
+        result.update(summarize(measure(function, warmup, repeat), len(data)))
+        result['peak_traced_bytes'] = peak_memory(function) if trace_memory else None
+        result['max_rss_bytes'] = max_rss()
+        results.append(result)
+    return results
+
+def result_key(result):
+    # Reports from before the entropy stage have no 'entropy' field
+    return (result['corpus'], result['size'], result['trie_type'], result['max_bits'], result.get('entropy', False), result['operation'])
+
+def compare(results, baseline_file):
+    """Print the change in median throughput against an earlier JSON report."""
+    with open(baseline_file, 'r', encoding='utf-8') as file:
+        baseline = {result_key(result): result for result in json.load(file)['results']}
+    print(f"\nChange against {baseline_file} (median MB/s):")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None or not old['mb_per_s']:
+            continue
+        change = (result['mb_per_s'] / old['mb_per_s'] - 1) * 100
+        print(f"{result['corpus']:<12}{format_size(result['size']):<8}{result['trie_type']:<10}{result['max_bits']:<4}"
+              f"{'entropy' if result.get('entropy') else '':<8}{result['operation']:<15}{old['mb_per_s']:>9.2f} -> {result['mb_per_s']:>9.2f}  {change:+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LZW compression and decompression")
+    parser.add_argument('--corpus', nargs='+', choices=CORPORA, help="Synthetic corpora to generate (default: text, unless --file is given)")
+    parser.add_argument('--file', nargs='+', default=[], help="Local files to use as corpora")
+    parser.add_argument('--sizes', nargs='+', help="Corpus sizes, e.g. 64K 1M 100M (default: 1M, or the whole file)")
+    parser.add_argument('--trie', nargs='+', choices=TRIE_TYPES, default=list(TRIE_TYPES), help="Trie backends to run")
+    parser.add_argument('--max-bits', nargs='+', type=int, default=[12], help="max_bits values to run")
+    parser.add_argument('--entropy', action='store_true', help="Also run every measurement with the entropy-coding stage")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs before the timed trials")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed trials per measurement")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic corpora")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc run (it is slow on big inputs)")
+    parser.add_argument('--output', type=str, help="Write the results to this JSON file")
+    parser.add_argument('--compare', type=str, help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        print("Error: --repeat must be at least 1.")
+        sys.exit(1)
+    sizes = [parse_size(size) for size in args.sizes] if args.sizes else None
+
+    # (name, data for each size) per corpus; files are cut to each size given with --sizes
+    corpora = []
+    for path in args.file:
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except OSError as e:
+            print(f"Error: Could not read '{path}': {e}")
+            sys.exit(1)
+        corpora.append((os.path.basename(path), [content[:size] for size in sizes] if sizes else [content]))
+    for kind in args.corpus or ([] if args.file else ['text']):
+        corpora.append((kind, synthetic_inputs(kind, sizes or [SIZE_UNITS['M']], args.seed)))
+
+    results = []
+    for corpus, inputs in corpora:
+        for data in inputs:
+            for trie in args.trie:
+                for max_bits in args.max_bits:
+                    for entropy in ((False, True) if args.entropy else (False,)):
+                        for result in bench_one(corpus, data, trie, max_bits, args.warmup, args.repeat, not args.no_memory, entropy):
+                            results.append(result)
+                            print(f"{corpus:<12}{format_size(len(data)):<8}{trie:<10}{max_bits:<4}{'entropy' if entropy else '':<8}{result['operation']:<15}"
+                                  f"{result['mb_per_s']:>9.2f} MB/s {result['ns_per_byte']:>9.1f} ns/B  ratio {result['ratio']:.3f}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'warmup': args.warmup,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults have been saved to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
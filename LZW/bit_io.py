@@ -0,0 +1,75 @@
+# bit_io.py
+
+# Variable-width code packing. Codes are stored LSB-first (the same bit order
+# used by Unix compress and GIF), so a code of width w occupies the next w bits
+# of the stream starting from the least significant bit of the current byte.
+
+# Whole bytes are moved between the accumulator and the buffer in blocks of
+# this many bits, instead of one byte (or one bit) at a time
+FLUSH_BITS = 1024
+REFILL_BYTES = 64
+
+class BitWriter:
+    def __init__(self, buffer=None):
+        self.buffer = bytearray() if buffer is None else buffer
+        self.accumulator = 0
+        self.bit_count = 0  # Number of pending bits held in the accumulator
+        self.bits_written = 0
+
+    def write(self, code, width):
+        self.accumulator |= code << self.bit_count
+        self.bit_count += width
+        if self.bit_count >= FLUSH_BITS:
+            self._flush_bytes()
+
+    def _flush_bytes(self):
+        # Move every complete byte from the accumulator into the buffer at once
+        byte_count = self.bit_count >> 3
+        flushed_bits = byte_count << 3
+        self.buffer += (self.accumulator & ((1 << flushed_bits) - 1)).to_bytes(byte_count, 'little')
+        self.accumulator >>= flushed_bits
+        self.bit_count -= flushed_bits
+        self.bits_written += flushed_bits
+
+    def flush(self):
+        # Write out everything, padding the last byte with zero bits
+        self._flush_bytes()
+        if self.bit_count:
+            self.buffer.append(self.accumulator)
+            self.bits_written += self.bit_count
+            self.accumulator = 0
+            self.bit_count = 0
+        return self.buffer
+
+    def drain(self):
+        # Hand over the complete bytes written so far, keeping pending bits
+        data = bytes(self.buffer)
+        del self.buffer[:]
+        return data
+
+    def get_bit_length(self):
+        return self.bits_written + self.bit_count
+
+class BitReader:
+    def __init__(self, data, start=0, end=None):
+        self.data = data
+        self.position = start  # Next byte of data to load into the accumulator
+        self.end = len(data) if end is None else end
+        self.accumulator = 0
+        self.bit_count = 0
+
+    def read(self, width):
+        # Returns the next code, or None once fewer than width bits are left
+        # (the final byte is padded with fewer than 8 bits, and codes are at least 9 bits wide)
+        if self.bit_count < width:
+            chunk = self.data[self.position:min(self.position + REFILL_BYTES, self.end)]
+            self.accumulator |= int.from_bytes(chunk, 'little') << self.bit_count
+            self.bit_count += len(chunk) << 3
+            self.position += len(chunk)
+            if self.bit_count < width:
+                return None
+
+        code = self.accumulator & ((1 << width) - 1)
+        self.accumulator >>= width
+        self.bit_count -= width
+        return code
@@ -0,0 +1,145 @@
+# lzw_async.py
+
+import asyncio
+import time
+from lzw_stream import LZWStreamCompressor, LZWStreamDecompressor
+
+# Compression for asyncio services. A one-shot compress() holds the event loop
+# for as long as it runs, so here the stream codecs of lzw_stream.py are driven
+# in steps instead: each step feeds them a slice of input sized to take about
+# time_budget seconds (measured as the job goes), and the coroutine yields to
+# the loop between steps. With an executor (e.g. a ThreadPoolExecutor) the
+# steps run there instead and the loop only waits for them.
+#
+# Output is written with await writer.drain(), and no more input is read until
+# the sink has taken it, so a slow client holds back the reading of its own
+# request instead of letting buffers grow. At most max_concurrency jobs run at
+# once; the others wait for a free slot.
+ASYNC_CHUNK_SIZE = 1 << 16  # Input read from a StreamReader at a time
+DEFAULT_TIME_BUDGET = 0.005  # Seconds of work per step
+MIN_STEP_SIZE = 256
+FIRST_STEP_SIZE = 4096
+
+class LZWAsyncService:
+    def __init__(self, max_concurrency=4, executor=None, time_budget=DEFAULT_TIME_BUDGET, chunk_size=ASYNC_CHUNK_SIZE):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+        if time_budget <= 0:
+            raise ValueError(f"time_budget must be positive, got {time_budget}")
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = executor
+        self.time_budget = time_budget
+        self.chunk_size = chunk_size
+
+    async def compress_stream(self, reader, writer, **options):
+        # Compress everything read from reader (an asyncio.StreamReader) into
+        # writer (an asyncio.StreamWriter) as a streamed .lzw container, with the
+        # length and checksum in its trailer. options are the LZWStreamCompressor
+        # arguments. Returns the number of bytes read.
+        async with self.semaphore:
+            stream = LZWStreamCompressor(**options)
+            await self._pump(stream.feed, lambda: reader.read(self.chunk_size), lambda data: _write(writer, data))
+            await _write(writer, await self._call(stream.flush))
+            return stream.original_length
+
+    async def decompress_stream(self, reader, writer, dictionary=None):
+        # Decompress a .lzw container read from reader into writer, returning the
+        # number of bytes written
+        async with self.semaphore:
+            stream = LZWStreamDecompressor(dictionary)
+            await self._pump(stream.feed, lambda: reader.read(self.chunk_size), lambda data: _write(writer, data))
+            await _write(writer, await self._call(stream.flush))
+            return stream.original_length
+
+    async def compress(self, data, **options):
+        # The same container as LZWCompressor(**options).compress(data, packed=True),
+        # made without blocking the loop
+        async with self.semaphore:
+            stream = LZWStreamCompressor(**options)
+            output = bytearray()
+            await self._pump(stream.feed, _reads(data, self.chunk_size), _extend(output))
+            output += await self._call(stream.flush, False)
+            header = stream.final_header().pack()
+            output[:len(header)] = header
+            return output
+
+    async def decompress(self, data, dictionary=None):
+        async with self.semaphore:
+            stream = LZWStreamDecompressor(dictionary)
+            output = bytearray()
+            await self._pump(stream.feed, _reads(data, self.chunk_size), _extend(output))
+            output += await self._call(stream.flush)
+            return output
+
+    async def _call(self, function, *args):
+        if self.executor is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _pump(self, feed, read, write):
+        # Pass every chunk from read() through feed() and the result to write(),
+        # feeding at most step_size bytes at a time. In the loop, step_size follows
+        # the measured speed so that every step takes about time_budget.
+        step_size = FIRST_STEP_SIZE
+        while True:
+            chunk = await read()
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            position = 0
+            while position < len(view):
+                if self.executor is not None:
+                    # The loop is not held up by the work, only feed whole chunks
+                    step = bytes(view[position:])
+                    output = await self._call(feed, step)
+                else:
+                    step = bytes(view[position:position + step_size])
+                    start = time.perf_counter()
+                    output = feed(step)
+                    elapsed = time.perf_counter() - start
+                    if elapsed > 0:
+                        # Halfway towards the size that would have taken exactly time_budget
+                        step_size = max(MIN_STEP_SIZE, (step_size + int(len(step) * self.time_budget / elapsed)) // 2)
+                    await asyncio.sleep(0)
+                position += len(step)
+                if output:
+                    await write(output)
+
+async def _write(writer, data):
+    # Wait until the transport has room again before producing more output
+    writer.write(data)
+    await writer.drain()
+
+def _reads(data, chunk_size):
+    # A read() over an in-memory buffer
+    view = memoryview(data)
+    position = 0
+    async def read():
+        nonlocal position
+        chunk = view[position:position + chunk_size]
+        position += len(chunk)
+        return chunk
+    return read
+
+def _extend(output):
+    async def write(data):
+        output.extend(data)
+    return write
+
+async def serve(service=None, host='127.0.0.1', port=0, decompress=False, **options):
+    # A minimal server to try a service locally, in the same process as its
+    # clients: every connection sends its data and closes its side (write_eof),
+    # then reads back the compressed (or decompressed) data until the server
+    # closes. port=0 picks a free port, see server.sockets[0].getsockname().
+    service = service or LZWAsyncService()
+
+    async def handle(reader, writer):
+        try:
+            if decompress:
+                await service.decompress_stream(reader, writer, **options)
+            else:
+                await service.compress_stream(reader, writer, **options)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+    return await asyncio.start_server(handle, host, port)
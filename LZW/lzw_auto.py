@@ -0,0 +1,191 @@
+# lzw_auto.py
+
+import math
+from collections import Counter
+from lzw_compressor import LZWCompressor, TRIE_TYPES, STORE_SAMPLE_SIZE
+from lzw_container import HEADER_SIZE
+
+# Automatic choice of max_bits, fixed or variable width and trie backend for an
+# input, instead of running the whole matrix of settings on every kind of data.
+# The choice comes from a profile of the input: its length, the entropy of its
+# bytes, and trial compressions of a sample from its start.
+#
+# Once its table is full, LZW keeps using the same phrases, and their length
+# grows about linearly with the bits of the table. The bytes per code of the
+# tables that are full by the middle of the sample are measured on its second
+# half and extended along a line to the larger tables; the input fills tables
+# up to about 2**b = 256 + codes, and a larger table gives the same codes.
+# Fixed width writes the same codes as variable width, all at max_bits. Time
+# and memory follow the rough costs of each backend below. Input whose sample
+# bytes are close to random is not tried at all: it will be stored (see
+# store_incompressible in lzw_compressor.py).
+#
+# goal='ratio' picks the smallest predicted output, preferring the larger table
+# among near ties (a small table that fills up cannot follow data that changes
+# after the sample), then the faster one; goal='speed' the fastest compression,
+# then the smaller output. memory_limit (bytes) rules out the settings whose
+# dictionary would not fit, or keeps the smallest one if none does.
+GOALS = ('ratio', 'speed')
+AUTO_FIELDS = ['auto_goal', 'memory_limit', 'predicted_ratio']  # Columns added to stats.csv by --auto
+AUTO_SAMPLE_SIZE = 8192
+MIN_AUTO_BITS = 9
+MAX_AUTO_BITS = 16
+UNKNOWN_LENGTH = 1 << 30  # Input of unknown length (a pipe) is planned for as large
+INCOMPRESSIBLE_ENTROPY = 7.9  # Bits per byte above which the sample is not tried
+RATIO_TOLERANCE = 0.01  # Relative difference of predicted ratios that is a tie
+TIME_TOLERANCE = 0.05  # Relative difference of predicted times that is a tie
+
+# Rough compression costs measured with CPython 3.11, in nanoseconds: per input
+# byte, per code written, and the exponent of the slowdown once the dictionary
+# holds more than SLOWDOWN_ENTRIES entries (more objects for the garbage
+# collector, more cache misses). Only their relative sizes matter.
+TIME_COSTS = {'standard': (320, 460, 0.5), 'compact': (430, 1060, 0.45), 'flat': (710, 450, 0.15)}
+SLOWDOWN_ENTRIES = 4096
+# Dictionary memory: bytes per entry of the node tries, and the table of the
+# flat trie, allocated for every code up front
+ENTRY_BYTES = {'standard': 210, 'compact': 215}
+FLAT_BASE_BYTES = 280000
+FLAT_SLOT_BYTES = 33
+
+def byte_entropy(data):
+    # Shannon entropy of the bytes of data, in bits per byte
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+class InputProfile:
+    # What the cost model knows about an input: its length, the entropy of its
+    # sample and the trial compressions of the sample, made as they are needed
+    def __init__(self, sample, length=None):
+        self.sample = bytes(sample[:AUTO_SAMPLE_SIZE])
+        self.length = len(sample) if length is None else length
+        self.entropy = byte_entropy(self.sample)
+        self.incompressible = self.entropy > INCOMPRESSIBLE_ENTROPY or not self.sample
+        self.trials = {}  # (max_bits, sample length) -> (codes, bits written, whether the table filled up)
+        self.line = None  # (intercept, slope) of bytes per code over max_bits
+        self.full_bits = None
+
+    def trial(self, bits, length=None):
+        # Compress the first length bytes of the sample (all of it by default)
+        length = len(self.sample) if length is None else length
+        if (bits, length) not in self.trials:
+            smaller = self.trials.get((bits - 1, length))
+            if smaller is not None and not smaller[2]:
+                # A table that never filled up gives the same codes with more room
+                self.trials[bits, length] = smaller
+            else:
+                compressor = LZWCompressor(max_bits=bits, store_incompressible=False)
+                output = compressor.compress(self.sample[:length], packed=True)
+                self.trials[bits, length] = (compressor.code_count, (len(output) - HEADER_SIZE) * 8,
+                                             compressor.dict_size >= compressor.max_table_size)
+        return self.trials[bits, length]
+
+    def phrase_length(self, bits):
+        # Bytes per code with a full table of 2**bits entries
+        if self.line is None:
+            half = len(self.sample) // 2
+            points = []
+            for trial_bits in range(MIN_AUTO_BITS, MAX_AUTO_BITS + 1):
+                half_codes, _, filled = self.trial(trial_bits, half)
+                if not filled:
+                    break
+                points.append((trial_bits, (len(self.sample) - half) / max(self.trial(trial_bits)[0] - half_codes, 1)))
+            if len(points) >= 2:
+                # Least squares, never shrinking with the table
+                mean_bits = sum(point[0] for point in points) / len(points)
+                mean_length = sum(point[1] for point in points) / len(points)
+                slope = max(0, sum((x - mean_bits) * (y - mean_length) for x, y in points)
+                            / sum((x - mean_bits) ** 2 for x, _ in points))
+                self.line = (mean_length - slope * mean_bits, slope)
+            elif points:
+                self.line = (0, points[0][1] / points[0][0])
+            else:
+                # Not even the smallest table filled up in time
+                self.line = (len(self.sample) / self.trial(MIN_AUTO_BITS)[0], 0)
+        intercept, slope = self.line
+        return max(1.0, intercept + slope * bits)
+
+    def useful_bits(self):
+        # The table size past which the input gives the same codes, as the
+        # (fractional) bits where 2**bits = 256 + codes, found by bisection
+        if self.full_bits is None:
+            if self.length <= len(self.sample):
+                self.full_bits = next((bits for bits in range(MIN_AUTO_BITS, MAX_AUTO_BITS + 1) if not self.trial(bits)[2]),
+                                      MAX_AUTO_BITS)
+            else:
+                low, high = MIN_AUTO_BITS, 64
+                for _ in range(40):
+                    middle = (low + high) / 2
+                    if 2 ** middle < 256 + self.length / self.phrase_length(middle):
+                        low = middle
+                    else:
+                        high = middle
+                self.full_bits = high
+        return self.full_bits
+
+    def predict(self, max_bits, fixedLZW, trie):
+        # Predicted ratio (of the container, like the stats), compression time
+        # (seconds) and dictionary memory (bytes)
+        if self.incompressible:
+            code_bytes, codes_per_byte = self.length, 1.0
+        elif self.length <= len(self.sample):
+            # The sample is the whole input: the trial is the real thing
+            codes, bits_written, _ = self.trial(max_bits)
+            codes_per_byte = codes / self.length
+            code_bytes = (codes * max_bits if fixedLZW else bits_written) / 8
+        else:
+            bits = min(max_bits, self.useful_bits())
+            codes_per_byte = 1 / self.phrase_length(bits)
+            code_bytes = self.length * codes_per_byte * (max_bits if fixedLZW else bits) / 8
+        stored = code_bytes >= self.length
+        ratio = (min(code_bytes, self.length) + HEADER_SIZE) / self.length if self.length else 0
+
+        entries = min(2 ** max_bits, 256 + self.length * codes_per_byte)
+        byte_ns, code_ns, slowdown = TIME_COSTS[trie]
+        # Stored input is only encoded up to the end of the store sample
+        encoded = min(self.length, STORE_SAMPLE_SIZE) if stored else self.length
+        seconds = encoded * (byte_ns + code_ns * codes_per_byte) * max(1, entries / SLOWDOWN_ENTRIES) ** slowdown / 1e9
+        if trie == 'flat':
+            memory = FLAT_BASE_BYTES + FLAT_SLOT_BYTES * 2 ** max_bits
+        else:
+            memory = ENTRY_BYTES[trie] * entries
+        return ratio, seconds, memory, stored
+
+def choose_options(sample, length=None, goal='ratio', memory_limit=None, min_bits=MIN_AUTO_BITS):
+    # Pick max_bits, fixedLZW and trie for an input from sample, its first bytes
+    # (or all of it), and its length if sample is not all of it. min_bits is the
+    # smallest max_bits allowed (a trained dictionary needs room for its
+    # phrases). Returns the LZWCompressor options and the predicted ratio.
+    if goal not in GOALS:
+        raise ValueError(f"Unknown goal: {goal} (expected one of {', '.join(GOALS)})")
+    profile = InputProfile(sample, length)
+
+    # Tables larger than the input can fill only take more memory
+    smallest_bits = max(MIN_AUTO_BITS, min_bits)
+    largest_bits = MIN_AUTO_BITS if profile.incompressible else min(MAX_AUTO_BITS, math.ceil(profile.useful_bits()))
+    largest_bits = max(largest_bits, smallest_bits)
+    candidates = []
+    for trie in TRIE_TYPES:
+        for max_bits in range(smallest_bits, largest_bits + 1):
+            for fixedLZW in (False, True):
+                ratio, seconds, memory, stored = profile.predict(max_bits, fixedLZW, trie)
+                # The table of stored input makes no difference to its size
+                preference = 0 if stored else -max_bits
+                candidates.append((ratio, seconds, memory, preference, dict(max_bits=max_bits, fixedLZW=fixedLZW, trie=trie)))
+    if memory_limit is not None:
+        fitting = [candidate for candidate in candidates if candidate[2] <= memory_limit]
+        candidates = fitting or [min(candidates, key=lambda candidate: candidate[2])]
+
+    # Near ties are decided as described above, then by the smaller dictionary
+    # and by variable width
+    if goal == 'ratio':
+        best = min(candidate[0] for candidate in candidates)
+        candidates = [candidate for candidate in candidates if candidate[0] <= best * (1 + RATIO_TOLERANCE)]
+        key = lambda candidate: (candidate[3], candidate[1], candidate[2], candidate[4]['fixedLZW'])
+    else:
+        best = min(candidate[1] for candidate in candidates)
+        candidates = [candidate for candidate in candidates if candidate[1] <= best * (1 + TIME_TOLERANCE)]
+        key = lambda candidate: (candidate[0], candidate[2], candidate[4]['fixedLZW'])
+    ratio, _, _, _, options = min(candidates, key=key)
+    return options, ratio
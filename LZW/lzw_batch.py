@@ -0,0 +1,70 @@
+# lzw_batch.py
+
+from array import array
+from itertools import islice
+from lzw_blocks import run_ordered
+from lzw_compressor import LZWCompressor
+from lzw_decompressor import LZWDecompressor
+
+# Batches of many small, independent payloads (records, messages) in one call.
+# Every payload becomes a complete .lzw container, so each one can still be
+# decompressed on its own; the containers are stored back to back in one
+# buffer, and offsets[i]:offsets[i + 1] is the container of payload i. A single
+# compressor (or decompressor) goes through a whole run of payloads, only
+# resetting its dictionary in between, see LZWCompressor.compress_many().
+#
+# With more than one worker, runs of records_per_task payloads are sent to a
+# process pool. Starting the pool costs far more than compressing a few
+# thousand short records, so batches run in-process unless workers is given.
+RECORDS_PER_TASK = 4096
+
+def _runs(items, size):
+    items = iter(items)
+    while True:
+        run = list(islice(items, size))
+        if not run:
+            break
+        yield run
+
+def _compress_run(payloads, options):
+    # Runs in a worker process
+    return LZWCompressor(**options).compress_many(payloads)
+
+def _decompress_run(run, dictionary):
+    # Runs in a worker process
+    compressed_data, offsets = run
+    return LZWDecompressor(dictionary=dictionary).decompress_many(compressed_data, offsets)
+
+def _join(results):
+    # One buffer and offset array from the (buffer, offsets) of every run
+    output = bytearray()
+    offsets = array('Q', [0])
+    for buffer, run_offsets in results:
+        base = len(output)
+        output += buffer
+        offsets.extend(base + offset for offset in run_offsets[1:])
+    return output, offsets
+
+def compress_many(payloads, workers=1, records_per_task=RECORDS_PER_TASK, **options):
+    # Compress every payload of an iterable; options are passed on to
+    # LZWCompressor. Returns the containers in one bytearray and their offsets.
+    if workers <= 1:
+        return LZWCompressor(**options).compress_many(payloads)
+    runs = (list(map(bytes, run)) for run in _runs(payloads, records_per_task))
+    return _join(run_ordered(_compress_run, runs, workers, options))
+
+def decompress_many(compressed_data, offsets, workers=1, records_per_task=RECORDS_PER_TASK, dictionary=None):
+    # Decompress the containers at compressed_data[offsets[i]:offsets[i + 1]], as
+    # written by compress_many(). dictionary is the LZWDictionary they were
+    # compressed with, if any. Returns the payloads in one bytearray and their offsets.
+    if workers <= 1:
+        return LZWDecompressor(dictionary=dictionary).decompress_many(compressed_data, offsets)
+
+    view = memoryview(compressed_data)
+    def runs():
+        for first in range(0, len(offsets) - 1, records_per_task):
+            last = min(first + records_per_task, len(offsets) - 1)
+            start = offsets[first]
+            # Each worker gets a copy of its run, with offsets from the start of that copy
+            yield bytes(view[start:offsets[last]]), array('Q', (offset - start for offset in offsets[first:last + 1]))
+    return _join(run_ordered(_decompress_run, runs(), workers, dictionary))
@@ -0,0 +1,196 @@
+# lzw_blocks.py
+
+import os
+import struct
+import time
+from collections import deque
+from lzw_compressor import LZWCompressor
+from lzw_decompressor import LZWDecompressor
+
+# A block archive splits the input into blocks of block_size bytes and stores
+# each one as an independent .lzw container, so blocks can be compressed and
+# decompressed on different cores. Layout:
+#   header: magic (4) | version (1) | block size (8)
+#   the block containers, back to back
+#   index:  per block, compressed length (8) | original length (8)
+#   footer: index offset (8) | block count (4) | magic (4)
+# The index is written last so an archive can be written in one pass, even to
+# a pipe.
+BLOCK_MAGIC = b'LZWB'
+BLOCK_VERSION = 1
+BLOCK_HEADER_FORMAT = '<4sBQ'
+BLOCK_HEADER_SIZE = struct.calcsize(BLOCK_HEADER_FORMAT)
+INDEX_ENTRY_FORMAT = '<QQ'
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+FOOTER_FORMAT = '<QI4s'
+FOOTER_SIZE = struct.calcsize(FOOTER_FORMAT)
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+def _compress_block(block, options):
+    # Runs in a worker process; the block length goes back for the index
+    compressed_data, stats = LZWCompressor(**options).compress(block, generate_stats=True, packed=True)
+    stats['original_length'] = len(block)
+    return compressed_data, stats
+
+def _decompress_block(block, dictionary):
+    # Runs in a worker process
+    return LZWDecompressor(dictionary=dictionary).decompress(block, generate_stats=True, packed=True)
+
+def _block_stats(operation, ratio, block_size, block_stats, execution_time):
+    # Dictionary and memory figures are per block: each worker holds one dictionary at a time
+    return {
+        'operation': operation,
+        'ratio': ratio,
+        'dictionary_size': max((stats['dictionary_size'] for stats in block_stats), default=0),
+        'memory_usage': max((stats['memory_usage'] for stats in block_stats), default=0),
+        'peak_memory_usage': max((stats['peak_memory_usage'] for stats in block_stats), default=0),
+        'execution_time': execution_time,
+        'bits_used': max((stats['bits_used'] for stats in block_stats), default=0),
+        'block_size': block_size,
+        'block_count': len(block_stats)
+    }
+
+def run_ordered(function, items, workers, *args):
+    # Yield function(item, *args) for every item, in order. With more than one
+    # worker the calls run in a process pool, with at most two items per worker
+    # in flight so large inputs are never all queued (and copied) at once.
+    if workers <= 1:
+        for item in items:
+            yield function(item, *args)
+        return
+
+    # Imported here: it pulls in multiprocessing, which slows down every start-up
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+class BlockIndex:
+    def __init__(self, block_size, entries):
+        self.block_size = block_size
+        self.entries = entries  # (compressed offset, compressed length, original offset, original length) per block
+        self.original_length = sum(entry[3] for entry in entries)
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < BLOCK_HEADER_SIZE + FOOTER_SIZE:
+            raise ValueError("Data is too short to be an LZW block archive.")
+        magic, version, block_size = struct.unpack_from(BLOCK_HEADER_FORMAT, data)
+        index_offset, block_count, footer_magic = struct.unpack_from(FOOTER_FORMAT, data, len(data) - FOOTER_SIZE)
+        if magic != BLOCK_MAGIC or footer_magic != BLOCK_MAGIC:
+            raise ValueError("Data is not an LZW block archive (bad magic number).")
+        if version != BLOCK_VERSION:
+            raise ValueError(f"Unsupported LZW block archive version: {version}")
+        if index_offset + block_count * INDEX_ENTRY_SIZE + FOOTER_SIZE != len(data):
+            raise ValueError("LZW block archive is truncated or its index is corrupted.")
+
+        entries = []
+        compressed_offset = BLOCK_HEADER_SIZE
+        original_offset = 0
+        for compressed_length, original_length in struct.iter_unpack(INDEX_ENTRY_FORMAT, data[index_offset:len(data) - FOOTER_SIZE]):
+            entries.append((compressed_offset, compressed_length, original_offset, original_length))
+            compressed_offset += compressed_length
+            original_offset += original_length
+        if compressed_offset != index_offset:
+            raise ValueError("LZW block archive index does not match its contents.")
+        return cls(block_size, entries)
+
+class LZWBlockCompressor:
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, workers=None, cache=None, **options):
+        # options are passed on to LZWCompressor for every block; cache (an
+        # LZWCache, see lzw_cache.py) holds whole archives made by compress()
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 1
+        self.options = options
+        self.cache = cache
+
+    def compress(self, byte_sequence, generate_stats=False):
+        if self.cache is not None:
+            settings = ('blocks', self.block_size) + LZWCompressor(**self.options).cache_settings()
+            return self.cache.run(settings, byte_sequence, generate_stats,
+                                  lambda generate_stats: self._compress(byte_sequence, generate_stats),
+                                  self.options.get('trie'))
+        return self._compress(byte_sequence, generate_stats)
+
+    def _compress(self, byte_sequence, generate_stats):
+        start_time = time.time()
+        view = memoryview(byte_sequence)
+        # Worker processes need picklable blocks; in-process a memoryview slice avoids the copy
+        copy = bytes if self.workers > 1 else (lambda block: block)
+        blocks = (copy(view[i:i + self.block_size]) for i in range(0, len(view), self.block_size))
+
+        compressed_data = bytearray()
+        block_stats = self._write_blocks(blocks, compressed_data.extend)
+        end_time = time.time()
+
+        if generate_stats:
+            ratio = len(compressed_data) / len(view) if len(view) else 0
+            return compressed_data, _block_stats('compression', ratio, self.block_size, block_stats, end_time - start_time)
+        return compressed_data
+
+    def compress_stream(self, src, dst):
+        # Compress the binary file object src into dst, holding only a few blocks per worker in memory
+        def read_blocks():
+            while True:
+                block = src.read(self.block_size)
+                if not block:
+                    break
+                yield block
+        return self._write_blocks(read_blocks(), dst.write)
+
+    def _write_blocks(self, blocks, write):
+        write(struct.pack(BLOCK_HEADER_FORMAT, BLOCK_MAGIC, BLOCK_VERSION, self.block_size))
+        offset = BLOCK_HEADER_SIZE
+        index = bytearray()
+        block_stats = []
+        for block_data, stats in run_ordered(_compress_block, blocks, self.workers, self.options):
+            write(block_data)
+            offset += len(block_data)
+            index += struct.pack(INDEX_ENTRY_FORMAT, len(block_data), stats['original_length'])
+            block_stats.append(stats)
+        write(index)
+        write(struct.pack(FOOTER_FORMAT, offset, len(block_stats), BLOCK_MAGIC))
+        return block_stats
+
+class LZWBlockDecompressor:
+    def __init__(self, workers=None, dictionary=None, cache=None):
+        # dictionary is the LZWDictionary the blocks were compressed with, if any
+        self.workers = workers or os.cpu_count() or 1
+        self.dictionary = dictionary
+        self.cache = cache
+
+    def decompress(self, compressed_data, generate_stats=False):
+        if self.cache is not None:
+            settings = ('blocks-decompress', None if self.dictionary is None else self.dictionary.dictionary_id)
+            return self.cache.run(settings, compressed_data, generate_stats,
+                                  lambda generate_stats: self._decompress(compressed_data, generate_stats))
+        return self._decompress(compressed_data, generate_stats)
+
+    def _decompress(self, compressed_data, generate_stats):
+        start_time = time.time()
+        index = BlockIndex.unpack(compressed_data)
+        view = memoryview(compressed_data)
+        copy = bytes if self.workers > 1 else (lambda block: block)
+        blocks = (copy(view[offset:offset + length]) for offset, length, _, _ in index.entries)
+
+        # Every block lands at a known offset of a buffer allocated once
+        decompressed_data = bytearray(index.original_length)
+        block_stats = []
+        results = run_ordered(_decompress_block, blocks, self.workers, self.dictionary)
+        for (_, _, original_offset, original_length), (block_data, stats) in zip(index.entries, results):
+            if len(block_data) != original_length:
+                raise ValueError("LZW block archive index does not match its contents.")
+            decompressed_data[original_offset:original_offset + original_length] = block_data
+            block_stats.append(stats)
+        end_time = time.time()
+
+        if generate_stats:
+            ratio = len(decompressed_data) / len(compressed_data) if len(compressed_data) else 0
+            return decompressed_data, _block_stats('decompression', ratio, index.block_size, block_stats, end_time - start_time)
+        return decompressed_data
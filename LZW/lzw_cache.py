@@ -0,0 +1,131 @@
+# lzw_cache.py
+
+import hashlib
+import json
+import os
+import struct
+import time
+from collections import OrderedDict
+
+# A content-addressed cache of compression and decompression results. Pass one
+# as cache= to LZWCompressor, LZWDecompressor or the block archive classes:
+# before doing any work they look the result up under a hash of the input and
+# of every setting that changes the output (max_bits, fixed or variable width,
+# reset policy, restart interval, dictionary ID...). The trie backend does not
+# change the output, so all backends share one result; their stats differ
+# (memory above all), so those are kept per backend.
+#
+# Results are kept in memory, least recently used first out once they take up
+# more than max_bytes, and with a directory also on disk, one file per result,
+# where later runs find them. The disk tier is not limited in size.
+#
+# Layout of a cache file:
+#   stats length (4) | stats of every backend, as JSON | result
+DEFAULT_CACHE_BYTES = 64 << 20
+CACHE_FIELDS = ['cache_hits', 'cache_misses', 'cache_evictions']
+ENTRY_HEADER_FORMAT = '<I'
+ENTRY_HEADER_SIZE = struct.calcsize(ENTRY_HEADER_FORMAT)
+
+class LZWCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.entries = OrderedDict()  # key -> [result, stats per backend], most recently used last
+        self.size = 0  # Bytes of the results held in memory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(settings, data):
+        digest = hashlib.blake2b(repr(settings).encode('utf-8'), digest_size=20)
+        digest.update(data)
+        return digest.hexdigest()
+
+    def run(self, settings, data, generate_stats, function, variant=None):
+        # The result of function(generate_stats) for data and settings, computed
+        # only if it is not cached yet. function is called like compress() or
+        # decompress() and returns the same. variant names the backend the stats
+        # belong to; on a hit the stats are those of the run that was cached, with
+        # the time of the lookup as execution_time.
+        start_time = time.time()
+        key = self.key(settings, data)
+        entry = self._get(key)
+        if entry is not None and (not generate_stats or str(variant) in entry[1]):
+            self.hits += 1
+            result = bytearray(entry[0])
+            if not generate_stats:
+                return result
+            stats = dict(entry[1][str(variant)], execution_time=time.time() - start_time)
+        else:
+            self.misses += 1
+            if generate_stats:
+                result, stats = function(True)
+            else:
+                result = function(False)
+            if entry is None:
+                entry = [bytes(result), {}]
+            if generate_stats:
+                entry[1][str(variant)] = stats
+            self._put(key, entry)
+            if not generate_stats:
+                return result
+            stats = dict(stats)
+        stats.update(self.counters())
+        return result, stats
+
+    def counters(self):
+        return {'cache_hits': self.hits, 'cache_misses': self.misses, 'cache_evictions': self.evictions}
+
+    def clear(self):
+        # Empty the memory tier (the disk tier stays)
+        self.entries.clear()
+        self.size = 0
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        if self.directory is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, key), 'rb') as file:
+                data = file.read()
+            stats_length, = struct.unpack_from(ENTRY_HEADER_FORMAT, data)
+            stats_end = ENTRY_HEADER_SIZE + stats_length
+            entry = [data[stats_end:], json.loads(data[ENTRY_HEADER_SIZE:stats_end])]
+        except (OSError, ValueError, struct.error):
+            return None  # Not cached, or a damaged file that will be written again
+        self._remember(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+        stats = json.dumps(entry[1]).encode('utf-8')
+        path = os.path.join(self.directory, key)
+        # Written under a temporary name and renamed, so a reader never sees half a file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(struct.pack(ENTRY_HEADER_FORMAT, len(stats)) + stats)
+            file.write(entry[0])
+        os.replace(temporary_path, path)
+
+    def _remember(self, key, entry):
+        # Put entry in the memory tier, evicting the least recently used results
+        # to stay under max_bytes; a result larger than that is not kept
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[0])
+        if len(entry[0]) > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += len(entry[0])
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted[0])
+            self.evictions += 1
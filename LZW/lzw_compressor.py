@@ -1,69 +1,487 @@
 # lzw_compressor.py
 
 import time
+from array import array
+from bit_io import BitWriter
+from range_coder import RangeCodeWriter, MAX_ENTROPY_BITS
+from lzw_container import LZWHeader, HEADER_SIZE, DICTIONARY_ID_SIZE, CLEAR_CODE, compute_checksum, pack_restart_index
+from lzw_lru import LRUTable
+from lzw_memory import deep_sizeof
 from trie_standard import StandardTrie
 from trie_compact import CompactTrie
+from trie_flat import FlatTrie
+
+TRIE_TYPES = ('standard', 'compact', 'flat')
+
+# Inputs other than bytes and bytearray (mmap, memoryview, array...) are encoded
+# in copies of this many bytes: iterating over bytes is the fastest way to get
+# ints in the hot loop, and an mmap iterates as length-one bytes objects
+INPUT_CHUNK_SIZE = 1 << 20
+
+# Input encoded before deciding whether it is worth encoding at all, see
+# store_incompressible below
+STORE_SAMPLE_SIZE = 4096
+
+# What to do once the dictionary is full:
+#   'none'  - keep using it unchanged (the classic behaviour)
+#   'full'  - emit a CLEAR code and start over with a fresh dictionary
+#   'ratio' - keep it while it works, but emit CLEAR as soon as the ratio over the
+#             last reset_window input bytes is more than reset_threshold worse
+#             than the best window seen since the last reset (like Unix compress),
+#             or the window came out larger than it went in
+#   'lru'   - evict the least recently used leaf phrase and reuse its code for
+#             the new phrase, so the dictionary keeps following the data
+RESET_POLICIES = ('none', 'full', 'ratio', 'lru')
+
+# Independently of the policy, restart_interval starts a new dictionary (with a
+# CLEAR code) every restart_interval input bytes. Each restart point is recorded
+# in the container's index, so a range can be decoded from the nearest restart
+# point instead of from the start of the stream (see lzw_seekable.py).
+#
+# dictionary (an LZWDictionary, see lzw_dictionary.py) starts the dictionary
+# from trained phrases instead of only the single bytes, and every reset goes
+# back to that state. Its trie is built once per dictionary and configuration
+# and copied with restore() by every compressor using it.
+#
+# entropy=True range-codes the codes of packed output with an adaptive model
+# (see range_coder.py) instead of writing each one at the current width. It
+# shrinks the output by about a tenth on text, more on binary data, and costs
+# a few microseconds per code. Restart points are bit offsets into a bit-packed
+# stream, so it cannot be combined with restart_interval.
+#
+# store_incompressible=True (the default) keeps packed output from growing on
+# data LZW cannot compress (already compressed, encrypted or random data),
+# which would come out about a third larger. The first STORE_SAMPLE_SIZE bytes
+# are encoded first; if their codes take more room than the bytes themselves,
+# the rest is not encoded and the container stores the input as it is, only a
+# header larger than it (FLAG_STORED). If the codes of the whole input still
+# end up larger than the input, it is stored all the same. Input that only
+# starts out incompressible is stored whole, so mixed data is better split
+# into a block archive (lzw_blocks.py), which decides per block.
 
 class LZWCompressor:
-    def __init__(self, max_bits=12, use_compact_trie=False, fixedLZW=False):
+    def __init__(self, max_bits=12, use_compact_trie=False, fixedLZW=False, trie=None,
+                 reset_policy='none', reset_window=10000, reset_threshold=0.1, restart_interval=None,
+                 profiler=None, dictionary=None, cache=None, entropy=False, store_incompressible=True):
+        # trie selects the dictionary backend by name; use_compact_trie is kept as
+        # a shorthand for trie='compact'
+        if trie is None:
+            trie = 'compact' if use_compact_trie else 'standard'
+        if trie not in TRIE_TYPES:
+            raise ValueError(f"Unknown trie type: {trie} (expected one of {', '.join(TRIE_TYPES)})")
+        if reset_policy not in RESET_POLICIES:
+            raise ValueError(f"Unknown reset policy: {reset_policy} (expected one of {', '.join(RESET_POLICIES)})")
+        if restart_interval is not None and restart_interval <= 0:
+            raise ValueError(f"restart_interval must be positive, got {restart_interval}")
+        if entropy and restart_interval is not None:
+            raise ValueError("Entropy coding cannot be combined with restart_interval.")
+        if entropy and max_bits > MAX_ENTROPY_BITS:
+            raise ValueError(f"Entropy coding supports max_bits up to {MAX_ENTROPY_BITS}, got {max_bits}")
+
         self.max_bits = max_bits
         self.max_table_size = 2 ** max_bits
-        self.use_compact_trie = use_compact_trie
-        self.trie = CompactTrie() if use_compact_trie else StandardTrie()
+        self.trie_type = trie
+        self.use_compact_trie = trie == 'compact'
+        self.trie = self._new_trie()
         self.fixedLZW = fixedLZW
+        self.entropy = entropy
+        self.store_incompressible = store_incompressible
 
-    def compress(self, byte_sequence, generate_stats=False):
-        start_time = time.time()
+        self.reset_policy = reset_policy
+        self.reset_window = reset_window
+        self.reset_threshold = reset_threshold
+        self.restart_interval = restart_interval
+        # Code 256 is reserved for CLEAR whenever the dictionary may be reset
+        self.use_clear_code = reset_policy in ('full', 'ratio') or restart_interval is not None
+        self.use_lru = reset_policy == 'lru'
+        self.dictionary = dictionary
+        self.first_code = CLEAR_CODE + 1 if self.use_clear_code else 256
+        self.base_size = self.first_code + (len(dictionary) if dictionary is not None else 0)
+        if self.base_size > self.max_table_size:
+            raise ValueError(f"The dictionary has {len(dictionary)} entries, too many for max_bits={max_bits}")
+        # Start with 9 bits, or as many as the codes of a trained dictionary need
+        self.initial_bits = max_bits if fixedLZW else max(9, min(self.base_size.bit_length(), max_bits))
+        self.base_phrases = dictionary.phrases(self.first_code) if dictionary is not None and self.use_lru else None
+        self.trie_initialized = False
+        # Set by compress(generate_stats=True): measure the dictionary before every
+        # reset, where it is at its largest, to report the peak memory
+        self.track_memory = False
+        self.profiler = profiler  # An LZWProfiler to collect hot-path counters, see lzw_profile.py
+        self.cache = cache  # An LZWCache for the results of packed compress() calls, see lzw_cache.py
 
-        # Initialize the dictionary with individual bytes (0-255)
-        for i in range(256):
-            self.trie.insert(bytes([i]), i)
-        dict_size = 256
+    def _new_trie(self):
+        if self.trie_type == 'flat':
+            return FlatTrie(self.max_bits)
+        if self.trie_type == 'compact':
+            return CompactTrie()
+        return StandardTrie()
 
-        current_sequence = bytes()
-        compressed_data = []
+    def compress(self, byte_sequence, generate_stats=False, packed=False):
+        # With packed=True the result is a .lzw container (header followed by the
+        # bit-packed codes) instead of a list of integer codes
+        if not isinstance(byte_sequence, (bytes, bytearray)):
+            try:
+                # Any buffer is used in place, so a memory-mapped file is never read into memory as a whole
+                byte_sequence = memoryview(byte_sequence).cast('B')
+            except TypeError:
+                byte_sequence = bytes(byte_sequence)
 
-        # Start with 9 bits
-        current_bits = 9
-        if self.fixedLZW:
-            current_bits = self.max_bits
-        max_dict_size = 2 ** current_bits
+        if packed and self.cache is not None and self.profiler is None:
+            # Profiled runs are always measured for real
+            return self.cache.run(self.cache_settings(), byte_sequence, generate_stats,
+                                  lambda generate_stats: self._compress(byte_sequence, generate_stats, True), self.trie_type)
+        return self._compress(byte_sequence, generate_stats, packed)
 
-        for current_byte in byte_sequence:
-            next_sequence = current_sequence + bytes([current_byte])
-            if self.trie.search(next_sequence) is not None:
-                current_sequence = next_sequence
-            else:
-                # Output the code for current_sequence
-                compressed_data.append(self.trie.search(current_sequence))
+    def cache_settings(self):
+        # Everything besides the input that the packed output depends on
+        return ('compress', self.max_bits, self.fixedLZW, self.reset_policy, self.reset_window, self.reset_threshold,
+                self.restart_interval, self.dictionary_id, self.entropy, self.store_incompressible)
 
-                # Add next_sequence to the dictionary if size allows
-                if dict_size < self.max_table_size:
-                    if dict_size >= max_dict_size and current_bits < self.max_bits:
-                        current_bits += 1
-                        max_dict_size = 2 ** current_bits
+    def _compress(self, byte_sequence, generate_stats, packed):
+        start_time = time.time()
+        self.track_memory = generate_stats
 
-                    self.trie.insert(next_sequence, dict_size)
-                    dict_size += 1
+        if packed:
+            # Reserve room for the header, it is filled in once the stream is complete
+            header_size = self._header_size()
+            compressed_data = bytearray(header_size)
+            writer = self.new_writer(compressed_data)
+            emit = writer.write
+            tell = writer.get_bit_length
+        else:
+            compressed_data = []
+            append = compressed_data.append
+            emit = lambda code, bits: append(code)
+            tell = None
 
-                current_sequence = bytes([current_byte])
+        self.begin(emit, tell)
+        encoded = self._encode_input(byte_sequence, tell if packed and self.store_incompressible else None)
 
-        # Output the code for the remaining sequence, if any
-        if current_sequence:
-            compressed_data.append(self.trie.search(current_sequence))
+        output_start = time.perf_counter_ns()
+        if packed:
+            if encoded:
+                writer.flush()
+                self._write_header(compressed_data, 0, byte_sequence)
+            self._store_if_larger(compressed_data, 0, byte_sequence, encoded)
+        if self.profiler is not None:
+            self.profiler.output_time_ns += time.perf_counter_ns() - output_start
 
-        end_time = time.time()
-        compression_ratio = len(compressed_data) / len(byte_sequence)
+        # Measuring memory is left out of the execution time
+        end_time = time.time() - self.memory_sampling_time
+        # Codes per input byte for a code list, compressed bytes per input byte for a container
+        compression_ratio = len(compressed_data) / len(byte_sequence) if len(byte_sequence) else 0
 
         if generate_stats:
+            memory_usage = self.get_memory_usage()
             stats = {
                 'operation': 'compression',
                 'ratio': compression_ratio,
                 'dictionary_size': self.trie.get_dictionary_size(),  # Modified to use the trie method
-                'memory_usage': self.trie.get_memory_usage(),
+                'memory_usage': memory_usage,
+                'peak_memory_usage': max(self.peak_memory_usage, memory_usage),
                 'execution_time': end_time - start_time,
-                'bits_used': current_bits
+                'bits_used': self.current_bits
             }
+            if self.profiler is not None:
+                stats.update(self.profiler.summary())
             return compressed_data, stats
 
         return compressed_data
+
+    def compress_many(self, payloads, output=None):
+        # Compress every payload of an iterable into its own .lzw container, one
+        # after the other in output (a bytearray, appended to if given). Returns
+        # output and an array of offsets, one more than there are payloads:
+        # payload i is in output[offsets[i]:offsets[i + 1]]. Only the dictionary
+        # is reset between payloads, and the output buffer is shared, so a short
+        # record costs little more than encoding its bytes.
+        output = bytearray() if output is None else output
+        offsets = array('Q', [len(output)])
+        header_space = bytes(self._header_size())
+        self.track_memory = False
+        for payload in payloads:
+            if not isinstance(payload, (bytes, bytearray)):
+                payload = bytes(payload)
+            start = len(output)
+            output += header_space
+            writer = self.new_writer(output)  # Restart points count from the start of this code stream
+            self.begin(writer.write, writer.get_bit_length)
+            encoded = self._encode_input(payload, writer.get_bit_length if self.store_incompressible else None)
+            if encoded:
+                writer.flush()
+                self._write_header(output, start, payload)
+            self._store_if_larger(output, start, payload, encoded)
+            offsets.append(len(output))
+        return output, offsets
+
+    def _encode_input(self, byte_sequence, tell=None):
+        # Encode the whole input and end() it. With tell (the writer's output
+        # position), encode the sample first and stop there, returning False, if
+        # its codes came out larger than its bytes.
+        position = 0
+        if tell is not None:
+            position = min(STORE_SAMPLE_SIZE, len(byte_sequence))
+            self.encode(bytes(byte_sequence[:position]))
+            if tell() > position * 8:
+                return False
+        if position or isinstance(byte_sequence, memoryview):
+            for start in range(position, len(byte_sequence), INPUT_CHUNK_SIZE):
+                self.encode(bytes(byte_sequence[start:start + INPUT_CHUNK_SIZE]))
+        else:
+            self.encode(byte_sequence)
+        self.end()
+        return True
+
+    def _store_if_larger(self, output, start, byte_sequence, encoded):
+        # Replace the container at output[start:] with a stored one if it was not
+        # encoded or takes more room than that would
+        if not self.store_incompressible or (encoded and len(output) - start <= HEADER_SIZE + len(byte_sequence)):
+            return
+        header = LZWHeader(self.max_bits, original_length=len(byte_sequence),
+                           checksum=compute_checksum(byte_sequence), stored=True)
+        output[start:] = header.pack()
+        output += byte_sequence
+
+    def new_writer(self, buffer=None):
+        # The writer of packed codes, appending to buffer
+        if self.entropy:
+            return RangeCodeWriter(self.max_bits, buffer)
+        return BitWriter(buffer)
+
+    def _header_size(self):
+        return HEADER_SIZE + (DICTIONARY_ID_SIZE if self.dictionary is not None else 0)
+
+    def _write_header(self, output, start, byte_sequence):
+        # Fill in the header reserved at output[start:] once the code stream of
+        # byte_sequence follows it, and insert the restart index if there is one
+        header_size = self._header_size()
+        indexed = self.restart_interval is not None
+        header = LZWHeader(self.max_bits, self.fixedLZW, len(byte_sequence), compute_checksum(byte_sequence),
+                           use_clear_code=self.use_clear_code, use_lru=self.use_lru, indexed=indexed,
+                           dictionary_id=self.dictionary_id, entropy=self.entropy)
+        output[start:start + header_size] = header.pack()
+        if indexed:
+            output[start + header_size:start + header_size] = pack_restart_index(self.restart_points)
+
+    # Incremental interface: begin() once, encode() any number of chunks, then end().
+    # The state of the current phrase is kept between calls, so the codes are the
+    # same as compressing the concatenated chunks in one go. emit(code, bits) is
+    # called for every code together with the width it must be written with;
+    # tell() gives the current output position recorded for restart points (in
+    # codes if it is not given).
+    def begin(self, emit, tell=None):
+        self.reset()
+
+        # The hot loop goes through active_trie, which is the trie itself unless profiling
+        self.active_trie = self.trie
+        if self.profiler is not None:
+            self.profiler.reset()
+            self.active_trie, emit = self.profiler.wrap_compressor(self.trie, emit, CLEAR_CODE if self.use_clear_code else None)
+
+        self.emit = emit
+        self.tell = tell or (lambda: self.code_count)
+        self.root = self.trie.root_cursor()
+        self.cursor = self.root
+        self.code_count = 0
+        self.reset_count = 0
+        self.peak_memory_usage = 0
+        self.memory_sampling_time = 0
+
+        # State of the 'ratio' reset policy
+        self.clear_pending = self.reset_policy == 'full'
+        self.window_fill = 0
+        self.window_start_codes = 0
+        self.best_window_ratio = None
+
+        self.input_length = 0
+        self.restart_points = [(0, self.tell())]
+
+    def reset(self):
+        # Return the dictionary to its initial state (the single bytes, or the
+        # trained dictionary), so the instance can take an unrelated input;
+        # compress() and begin() call it. Only the first call builds the
+        # dictionary, later ones undo what was added to it since, so a reused
+        # compressor keeps its trie instead of allocating a new one.
+        if self.trie_initialized:
+            self.trie.reset()
+        elif self.dictionary is None:
+            # Initialize the dictionary with individual bytes (0-255)
+            for i in range(256):
+                self.trie.insert(bytes([i]), i)
+        else:
+            # A copy of the dictionary's trie, built once per configuration
+            self.trie.restore(self.dictionary.snapshot((self.trie_type, self.max_bits, self.first_code), self._build_snapshot))
+        self.trie_initialized = True
+
+        self.dict_size = self.base_size
+        self.current_bits = self.initial_bits
+        self.max_dict_size = 2 ** self.current_bits
+        self.lru = LRUTable(self.base_size, self.max_table_size, self.base_phrases) if self.use_lru else None
+
+    @property
+    def dictionary_id(self):
+        return None if self.dictionary is None else self.dictionary.dictionary_id
+
+    def _build_snapshot(self):
+        trie = self._new_trie()
+        self.dictionary.fill_trie(trie, self.first_code)
+        return trie.snapshot()
+
+    def encode(self, byte_sequence):
+        if self.reset_policy != 'ratio' and self.restart_interval is None:
+            self._encode(byte_sequence)
+            self.input_length += len(byte_sequence)
+            return
+
+        # Cut the input at every reset_window / restart_interval bytes of the
+        # overall stream (not of this call), so chunked input makes exactly the
+        # same decisions
+        if isinstance(byte_sequence, (bytes, bytearray)):
+            byte_sequence = memoryview(byte_sequence)
+        position = 0
+        while position < len(byte_sequence):
+            take = len(byte_sequence) - position
+            if self.restart_interval is not None:
+                # Restart lazily, once there is input after the boundary
+                if self.input_length and self.input_length % self.restart_interval == 0:
+                    self._restart()
+                take = min(take, self.restart_interval - self.input_length % self.restart_interval)
+            if self.reset_policy == 'ratio':
+                take = min(take, self.reset_window - self.window_fill)
+
+            self._encode(byte_sequence[position:position + take])
+            position += take
+            self.input_length += take
+            if self.reset_policy == 'ratio':
+                self.window_fill += take
+                if self.window_fill == self.reset_window:
+                    self._check_window()
+
+    def _restart(self):
+        # Finish the current phrase and start over with a fresh dictionary, so
+        # decoding can begin right after the CLEAR code
+        self.end()
+        # Reading that last code makes the decompressor add its pending phrase and
+        # possibly widen its codes, so CLEAR has to be written at the new width
+        if self.dict_size >= self.max_dict_size and self.current_bits < self.max_bits:
+            self.current_bits += 1
+        self.emit(CLEAR_CODE, self.current_bits)
+        self.code_count += 1
+
+        if self.track_memory:
+            self._sample_memory()
+        self.active_trie.reset()
+        self.dict_size = self.base_size
+        self.current_bits = self.initial_bits
+        self.max_dict_size = 2 ** self.current_bits
+        self.clear_pending = self.reset_policy == 'full'
+        self.best_window_ratio = None
+        if self.lru is not None:
+            self.lru = LRUTable(self.base_size, self.max_table_size, self.base_phrases)
+        self.restart_points.append((self.input_length, self.tell()))
+
+    def _check_window(self):
+        window_codes = self.code_count - self.window_start_codes
+        self.window_fill = 0
+        self.window_start_codes = self.code_count
+
+        # Only judge the dictionary once it is full and can no longer adapt
+        if self.dict_size < self.max_table_size:
+            return
+        ratio = window_codes * self.current_bits / (self.reset_window * 8)
+        if self.best_window_ratio is None or ratio < self.best_window_ratio:
+            self.best_window_ratio = ratio
+        elif ratio > self.best_window_ratio * (1 + self.reset_threshold):
+            self.clear_pending = True
+        if ratio >= 1:
+            # The dictionary no longer fits the data at all (it is expanding it),
+            # even if it never did better since the last reset
+            self.clear_pending = True
+
+    def _encode(self, byte_sequence):
+        # Walk the trie incrementally: the cursor always points at the node of the
+        # current phrase, so each input byte costs a single child lookup
+        trie = self.active_trie
+        step = trie.step
+        emit = self.emit
+        root = self.root
+        cursor = self.cursor
+        dict_size = self.dict_size
+        current_bits = self.current_bits
+        max_dict_size = self.max_dict_size
+        code_count = self.code_count
+        clear_pending = self.clear_pending
+        lru = self.lru
+
+        for current_byte in byte_sequence:
+            next_cursor = step(cursor, current_byte)
+            if next_cursor is not None:
+                cursor = next_cursor
+            else:
+                # Output the code for the current phrase
+                code = trie.cursor_index(cursor)
+                emit(code, current_bits)
+                code_count += 1
+                if lru is not None:
+                    lru.touch(code)
+
+                # Extend the current phrase by current_byte if size allows
+                if dict_size < self.max_table_size:
+                    if dict_size >= max_dict_size and current_bits < self.max_bits:
+                        current_bits += 1
+                        max_dict_size = 2 ** current_bits
+
+                    trie.insert_at(cursor, current_byte, dict_size)
+                    if lru is not None:
+                        lru.add(dict_size, code, current_byte)
+                    dict_size += 1
+                elif lru is not None:
+                    # Reuse the code of the least recently used leaf phrase, unless
+                    # that is the phrase being extended
+                    victim = lru.victim()
+                    if victim is not None and victim != code:
+                        trie.remove(lru.sequence(victim))
+                        lru.evict(victim)
+                        trie.insert_at(cursor, current_byte, victim)
+                        lru.add(victim, code, current_byte)
+                elif clear_pending:
+                    # Tell the decompressor to start over, then do the same here
+                    emit(CLEAR_CODE, current_bits)
+                    code_count += 1
+                    if self.track_memory:
+                        self._sample_memory()
+                    trie.reset()
+                    dict_size = self.base_size
+                    current_bits = self.initial_bits
+                    max_dict_size = 2 ** current_bits
+                    clear_pending = self.reset_policy == 'full'
+                    self.best_window_ratio = None
+                    self.reset_count += 1
+
+                cursor = step(root, current_byte)
+
+        self.cursor = cursor
+        self.dict_size = dict_size
+        self.current_bits = current_bits
+        self.max_dict_size = max_dict_size
+        self.code_count = code_count
+        self.clear_pending = clear_pending
+
+    def get_memory_usage(self):
+        # Deep size of the dictionary, including the LRU table if there is one
+        return self.trie.get_memory_usage() + (deep_sizeof(self.lru) if self.lru is not None else 0)
+
+    def _sample_memory(self):
+        start_time = time.time()
+        self.peak_memory_usage = max(self.peak_memory_usage, self.get_memory_usage())
+        self.memory_sampling_time += time.time() - start_time
+
+    def end(self):
+        # Output the code for the remaining phrase, if any
+        if self.cursor is not self.root:
+            code = self.active_trie.cursor_index(self.cursor)
+            self.emit(code, self.current_bits)
+            if self.lru is not None:
+                self.lru.touch(code)
+            self.code_count += 1
+            self.cursor = self.root
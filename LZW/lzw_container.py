@@ -0,0 +1,152 @@
+# lzw_container.py
+
+import struct
+import zlib
+
+# Layout of a .lzw file:
+#   magic (4 bytes) | version (1) | max_bits (1) | flags (1) | original length (8) | CRC-32 (4)
+# followed by the bit-packed code stream (see bit_io.py). Streams written where
+# the header cannot be rewritten afterwards set FLAG_STREAMED, leave the length
+# and checksum at zero and append them after the code stream as a trailer.
+# Streams compressed with restart points set FLAG_INDEXED and carry a restart
+# index between the header and the code stream:
+#   entry count (4) | per restart point: uncompressed offset (8) | bit offset (8)
+# where the bit offset counts from the start of the code stream.
+# Streams compressed with a trained dictionary (see lzw_dictionary.py) set
+# FLAG_DICTIONARY and follow the header with the dictionary ID (4), before any
+# restart index.
+# Streams with FLAG_ENTROPY hold the codes range-coded by an adaptive model
+# (see range_coder.py) instead of bit-packed at their width.
+# Streams with FLAG_STORED hold the original bytes as they are instead of codes
+# (input that LZW would have expanded); they have no restart index.
+MAGIC = b'LZW\x1a'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBQI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TRAILER_FORMAT = '<QI'
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+RESTART_COUNT_FORMAT = '<I'
+RESTART_COUNT_SIZE = struct.calcsize(RESTART_COUNT_FORMAT)
+RESTART_ENTRY_FORMAT = '<QQ'
+RESTART_ENTRY_SIZE = struct.calcsize(RESTART_ENTRY_FORMAT)
+DICTIONARY_ID_FORMAT = '<I'
+DICTIONARY_ID_SIZE = struct.calcsize(DICTIONARY_ID_FORMAT)
+FLAGS_OFFSET = struct.calcsize('<4sBB')
+
+FLAG_FIXED = 0x01  # Every code uses max_bits instead of growing from 9 bits
+FLAG_STREAMED = 0x02  # Length and checksum are in the trailer, not in the header
+FLAG_CLEAR = 0x04  # Code 256 is the CLEAR code that resets the dictionary
+FLAG_LRU = 0x08  # A full dictionary evicts its least recently used phrase
+FLAG_INDEXED = 0x10  # A restart index follows the header
+FLAG_DICTIONARY = 0x20  # The dictionary starts from a trained dictionary, whose ID follows the header
+FLAG_ENTROPY = 0x40  # The codes are range-coded instead of bit-packed
+FLAG_STORED = 0x80  # The payload is the original data, not codes
+
+CLEAR_CODE = 256
+
+class LZWHeader:
+    def __init__(self, max_bits, fixedLZW=False, original_length=0, checksum=0, streamed=False,
+                 use_clear_code=False, use_lru=False, indexed=False, dictionary_id=None, entropy=False,
+                 stored=False):
+        self.max_bits = max_bits
+        self.fixedLZW = fixedLZW
+        self.original_length = original_length
+        self.checksum = checksum
+        self.streamed = streamed
+        self.use_clear_code = use_clear_code
+        self.use_lru = use_lru
+        self.indexed = indexed
+        self.dictionary_id = dictionary_id
+        self.entropy = entropy
+        self.stored = stored
+
+    @property
+    def size(self):
+        # Bytes taken by pack(), including the optional dictionary ID
+        return HEADER_SIZE + (DICTIONARY_ID_SIZE if self.dictionary_id is not None else 0)
+
+    def pack(self):
+        flags = 0
+        if self.fixedLZW:
+            flags |= FLAG_FIXED
+        if self.streamed:
+            flags |= FLAG_STREAMED
+        if self.use_clear_code:
+            flags |= FLAG_CLEAR
+        if self.use_lru:
+            flags |= FLAG_LRU
+        if self.indexed:
+            flags |= FLAG_INDEXED
+        if self.dictionary_id is not None:
+            flags |= FLAG_DICTIONARY
+        if self.entropy:
+            flags |= FLAG_ENTROPY
+        if self.stored:
+            flags |= FLAG_STORED
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.max_bits, flags,
+                             self.original_length, self.checksum)
+        if self.dictionary_id is not None:
+            header += struct.pack(DICTIONARY_ID_FORMAT, self.dictionary_id)
+        return header
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < HEADER_SIZE:
+            raise ValueError("Data is too short to contain an LZW header.")
+
+        magic, version, max_bits, flags, original_length, checksum = struct.unpack_from(HEADER_FORMAT, data)
+        if magic != MAGIC:
+            raise ValueError("Data is not in the LZW container format (bad magic number).")
+        if version != VERSION:
+            raise ValueError(f"Unsupported LZW container version: {version}")
+        if not 9 <= max_bits <= 32:
+            raise ValueError(f"Invalid max_bits in LZW header: {max_bits}")
+
+        dictionary_id = None
+        if flags & FLAG_DICTIONARY:
+            if len(data) < HEADER_SIZE + DICTIONARY_ID_SIZE:
+                raise ValueError("LZW data is truncated (incomplete dictionary ID).")
+            dictionary_id, = struct.unpack_from(DICTIONARY_ID_FORMAT, data, HEADER_SIZE)
+
+        return cls(max_bits, bool(flags & FLAG_FIXED), original_length, checksum,
+                   bool(flags & FLAG_STREAMED), bool(flags & FLAG_CLEAR), bool(flags & FLAG_LRU),
+                   bool(flags & FLAG_INDEXED), dictionary_id, bool(flags & FLAG_ENTROPY),
+                   bool(flags & FLAG_STORED))
+
+    def pack_trailer(self):
+        return struct.pack(TRAILER_FORMAT, self.original_length, self.checksum)
+
+    def unpack_trailer(self, data):
+        # Fill in the length and checksum of a streamed container from its trailer
+        if len(data) < TRAILER_SIZE:
+            raise ValueError("Streamed LZW data is truncated (missing trailer).")
+        self.original_length, self.checksum = struct.unpack_from(TRAILER_FORMAT, data, len(data) - TRAILER_SIZE)
+
+def header_size(data):
+    # Size of the header at the start of data with its optional fields, or None
+    # if data is too short to tell
+    if len(data) < HEADER_SIZE:
+        return None
+    return HEADER_SIZE + (DICTIONARY_ID_SIZE if data[FLAGS_OFFSET] & FLAG_DICTIONARY else 0)
+
+def pack_restart_index(restart_points):
+    index = bytearray(struct.pack(RESTART_COUNT_FORMAT, len(restart_points)))
+    for original_offset, bit_offset in restart_points:
+        index += struct.pack(RESTART_ENTRY_FORMAT, original_offset, bit_offset)
+    return index
+
+def unpack_restart_index(data, offset=HEADER_SIZE):
+    # Returns the restart points and the offset just past the index, or None if
+    # data ends before the index does
+    if len(data) < offset + RESTART_COUNT_SIZE:
+        return None
+    count, = struct.unpack_from(RESTART_COUNT_FORMAT, data, offset)
+    start = offset + RESTART_COUNT_SIZE
+    end = start + count * RESTART_ENTRY_SIZE
+    if len(data) < end:
+        return None
+    return list(struct.iter_unpack(RESTART_ENTRY_FORMAT, data[start:end])), end
+
+def compute_checksum(data, value=0):
+    # CRC-32 of the uncompressed data; pass the previous value to continue a running checksum
+    return zlib.crc32(data, value)
@@ -1,82 +1,450 @@
 # lzw_decompressor.py
 
 import time
-import sys
-from trie_standard import StandardTrie
-from trie_compact import CompactTrie
+from array import array
+from bit_io import BitReader
+from range_coder import RangeCodeReader
+from lzw_container import LZWHeader, TRAILER_SIZE, CLEAR_CODE, compute_checksum, unpack_restart_index
+from lzw_lru import LRUTable
+from lzw_memory import deep_sizeof
 
 class LZWDecompressor:
-    def __init__(self, max_bits=12, fixedLZW=False):
+    def __init__(self, max_bits=12, fixedLZW=False, reset_policy='none', restart_interval=None, profiler=None,
+                 dictionary=None, cache=None):
+        # For a plain code list these must match the compressor's settings;
+        # containers record them in the header (for a trained dictionary, only
+        # its ID: the same LZWDictionary must be passed here)
         self.max_bits = max_bits
         self.max_table_size = 2 ** max_bits
         self.fixedLZW = fixedLZW
+        self.reset_policy = reset_policy
+        self.restart_interval = restart_interval
+        self.profiler = profiler  # An LZWProfiler to collect hot-path counters, see lzw_profile.py
+        self.dictionary = dictionary
+        self.table_key = None  # (first_code, dictionary ID) the table columns were built for
+        self.cache = cache  # An LZWCache for the results of packed decompress() calls, see lzw_cache.py
 
-    def decompress(self, compressed_data, generate_stats=False):
-        start_time = time.time()
-
-        # Initialize the dictionary with individual bytes (0-255)
-        dictionary = {i: bytes([i]) for i in range(256)}
-        dict_size = 256
-
-        # Start with 9 bits
-        current_bits = 9
-        if self.fixedLZW:
-            current_bits = self.max_bits
-        max_dict_size = 2 ** current_bits
-
-        if not compressed_data:
-            raise ValueError("Compressed data is empty; nothing to decompress.")
-
-        # Read the first code
-        current_code = compressed_data.pop(0)
-        if current_code >= dict_size:
-            raise ValueError(f"Invalid code found during decompression: {current_code}")
-
-        # Initialize the result with the first sequence
-        current_sequence = dictionary[current_code]
-        decompressed_data = bytearray(current_sequence)
-
-        # Iterate through the remaining codes
-        for code in compressed_data:
-            # Check if the code is in the dictionary
-            if code in dictionary:
-                entry = dictionary[code]
-            elif code == dict_size:
-                # Handle the case where the code is not in the dictionary yet (LZW edge case)
-                entry = current_sequence + current_sequence[0:1]
-            else:
-                raise ValueError(f"Invalid compressed code encountered: {code}")
-
-            # Append the entry to the decompressed data
-            decompressed_data.extend(entry)
+    def decompress(self, compressed_data, generate_stats=False, packed=False):
+        # With packed=True compressed_data is a .lzw container; max_bits and the
+        # fixed/variable mode are then taken from its header
+        if packed and self.cache is not None and self.profiler is None:
+            # The header holds every other setting
+            settings = ('decompress', None if self.dictionary is None else self.dictionary.dictionary_id)
+            return self.cache.run(settings, compressed_data, generate_stats,
+                                  lambda generate_stats: self._decompress(compressed_data, generate_stats, True))
+        return self._decompress(compressed_data, generate_stats, packed)
 
-            # Add new sequence to the dictionary
-            if len(dictionary) < self.max_table_size:
-                if dict_size >= max_dict_size and current_bits < self.max_bits:
-                    current_bits += 1
-                    max_dict_size = 2 ** current_bits
+    def _decompress(self, compressed_data, generate_stats, packed):
+        start_time = time.time()
 
-                dictionary[dict_size] = current_sequence + entry[0:1]
-                dict_size += 1
+        if packed:
+            header, payload_start, payload_end = self._begin_container(compressed_data)
+            next_code = self.code_reader(header, compressed_data, payload_start, payload_end)
+        else:
+            use_clear_code = self.reset_policy in ('full', 'ratio') or self.restart_interval is not None
+            self.begin(self.max_bits, self.fixedLZW, use_clear_code, self.reset_policy == 'lru',
+                       None if self.dictionary is None else self.dictionary.dictionary_id)
+            codes = iter(compressed_data)
+            next_code = lambda bits: next(codes, None)
 
-            current_sequence = entry
+        if packed:
+            # The header gives the exact output size, so the output buffer is
+            # allocated once and decoded into in place
+            decompressed_data = bytearray(header.original_length)
+            written = self._decode_container(header, next_code, compressed_data, payload_start, payload_end, decompressed_data)
+            del decompressed_data[written:]
+        else:
+            # A plain code list grows the output as needed
+            decompressed_data = bytearray()
+            del decompressed_data[self.decode(next_code, decompressed_data):]
+            if self.code_count == 0:
+                raise ValueError("Compressed data is empty; nothing to decompress.")
 
         end_time = time.time()
 
         # Calculate decompression ratio
         decompressed_bits = len(decompressed_data) * 8
-        compressed_bits = len(compressed_data) * current_bits + current_bits  # Include bits from the first code as well
-        decompression_ratio = decompressed_bits / compressed_bits
+        if packed:
+            compressed_bits = (payload_end - payload_start) * 8
+        else:
+            compressed_bits = self.code_count * self.current_bits
+        decompression_ratio = decompressed_bits / compressed_bits if compressed_bits else 0
 
         if generate_stats:
+            memory_usage = self.get_memory_usage()
             stats = {
                 'operation': 'decompression',
                 'ratio': decompression_ratio,
-                'dictionary_size': dict_size,
-                'memory_usage': sys.getsizeof(dictionary) + sum(sys.getsizeof(v) for v in dictionary.values()),
+                'dictionary_size': self.dict_size,
+                'memory_usage': memory_usage,
+                # The table columns only ever grow (a CLEAR overwrites them in place)
+                'peak_memory_usage': memory_usage,
                 'execution_time': end_time - start_time,
-                'bits_used': current_bits
+                'bits_used': self.current_bits
             }
+            if self.profiler is not None:
+                stats.update(self.profiler.summary())
             return decompressed_data, stats
 
         return decompressed_data
+
+    def decompress_into(self, compressed_data, output):
+        # Decompress the .lzw container compressed_data straight into output, a
+        # writable buffer (bytearray, memoryview, mmap...) of at least the
+        # original length given in the header, and return the number of bytes
+        # written to its start. Nothing is written past that length, and output is
+        # never resized. The result cache is not used: it would only hand back a
+        # copy to be copied again.
+        header, payload_start, payload_end = self._begin_container(compressed_data)
+        view = memoryview(output)
+        if view.readonly:
+            raise ValueError("The output buffer is read-only.")
+        view = view.cast('B')
+        if len(view) < header.original_length:
+            raise ValueError(f"The output buffer holds {len(view)} bytes; the data needs {header.original_length}.")
+        next_code = self.code_reader(header, compressed_data, payload_start, payload_end)
+        # A bytearray is decoded into directly, which is a little faster than through a view
+        target = output if type(output) is bytearray else view
+        return self._decode_container(header, next_code, compressed_data, payload_start, payload_end, target)
+
+    def _decode_container(self, header, next_code, compressed_data, start, end, output):
+        # Decode a container begun with _begin_container() into output, which has
+        # room for header.original_length bytes and is not enlarged, then verify
+        # its length and checksum. Returns the number of bytes written.
+        length = header.original_length
+        if next_code is None:
+            # A stored container holds the data itself
+            written = end - start
+            if written > length:
+                raise ValueError(f"Decompressed length {written} does not match the header ({length}).")
+            output[:written] = memoryview(compressed_data)[start:end]
+        else:
+            written = self.decode(next_code, output, limit=length)
+            if self.code_count == 0 and length:
+                raise ValueError("Compressed data is empty; nothing to decompress.")
+        with memoryview(output) as view:
+            self.verify(header, written, compute_checksum(view[:written]))
+        return written
+
+    def decompress_many(self, compressed_data, offsets, output=None):
+        # The reverse of LZWCompressor.compress_many(): decompress the .lzw
+        # containers at compressed_data[offsets[i]:offsets[i + 1]] one after the
+        # other into output (a bytearray, appended to if given). Returns output
+        # and the offsets of the payloads in it, in the same form. Every record
+        # is decoded into the same scratch buffer, which only grows to the
+        # longest one.
+        view = memoryview(compressed_data)
+        output = bytearray() if output is None else output
+        output_offsets = array('Q', [len(output)])
+        scratch = bytearray()
+        for index in range(len(offsets) - 1):
+            container = view[offsets[index]:offsets[index + 1]]
+            header, payload_start, payload_end = self._begin_container(container)
+            next_code = self.code_reader(header, container, payload_start, payload_end)
+            if next_code is None:
+                record = container[payload_start:payload_end]
+            else:
+                if len(scratch) < header.original_length:
+                    scratch.extend(bytes(header.original_length - len(scratch)))
+                written = self.decode(next_code, scratch)
+                if self.code_count == 0 and header.original_length:
+                    raise ValueError("Compressed data is empty; nothing to decompress.")
+                record = scratch[:written]
+            self.verify(header, len(record), compute_checksum(record))
+            output += record
+            output_offsets.append(len(output))
+        return output, output_offsets
+
+    @staticmethod
+    def code_reader(header, data, start, end):
+        # The next_code() function for the code stream at data[start:end], or None
+        # if the container is stored and holds no codes
+        if header.stored:
+            return None
+        if header.entropy:
+            return RangeCodeReader(header.max_bits, data, start, end).read
+        return BitReader(data, start, end).read
+
+    def _begin_container(self, compressed_data):
+        # Read the header of a .lzw container and begin() decoding it. Returns the
+        # header and where the code stream starts and ends.
+        header = LZWHeader.unpack(compressed_data)
+        payload_start = header.size
+        if header.indexed:
+            # Sequential decoding does not need the restart index, skip it
+            index = unpack_restart_index(compressed_data, header.size)
+            if index is None:
+                raise ValueError("LZW data is truncated (incomplete restart index).")
+            payload_start = index[1]
+        payload_end = len(compressed_data)
+        if header.streamed:
+            header.unpack_trailer(compressed_data)
+            payload_end -= TRAILER_SIZE
+        self.begin(header.max_bits, header.fixedLZW, header.use_clear_code, header.use_lru, header.dictionary_id)
+        return header, payload_start, payload_end
+
+    # Incremental interface: begin() once, then decode() whenever more codes are
+    # available. next_code(bits) returns the next code read with the given width,
+    # or None when no complete code is available (yet). dictionary_id is the ID
+    # of the trained dictionary the stream starts from, if any.
+    def begin(self, max_bits, fixedLZW, use_clear_code=False, use_lru=False, dictionary_id=None):
+        self.active_max_bits = max_bits
+        self.active_table_size = 2 ** max_bits
+        self.active_fixedLZW = fixedLZW
+        # Code 256 resets the dictionary when the stream was written with a reset policy
+        self.clear_code = CLEAR_CODE if use_clear_code else -1
+        self.first_code = CLEAR_CODE + 1 if use_clear_code else 256
+
+        self.active_use_lru = use_lru
+
+        # The dictionary is a table of (prefix code, last byte, length) columns:
+        # each phrase is an earlier phrase plus one byte, so it never has to be
+        # stored in full. offsets holds the position in the output where the
+        # phrase was last written, which lets it be copied with a single slice.
+        # Codes 0-255 are the individual bytes. A reused decompressor keeps its
+        # columns as long as they start the same way.
+        if dictionary_id is not None and (self.dictionary is None or self.dictionary.dictionary_id != dictionary_id):
+            raise ValueError(f"LZW data was compressed with dictionary {dictionary_id:08x}; pass that dictionary to decompress it.")
+        if self.table_key != (self.first_code, dictionary_id):
+            if dictionary_id is None:
+                self.prefixes = array('I', bytes(4 * self.first_code))
+                self.suffixes = array('B', bytes(range(256)) + bytes(self.first_code - 256))
+                self.lengths = array('I', [1] * self.first_code)
+                self.offsets = array('q', bytes(8 * self.first_code))
+                self.base_size = self.first_code
+            else:
+                # The initial columns are built once per dictionary, then copied
+                table = self.dictionary.snapshot(('table', self.first_code), self._build_table)
+                self.prefixes, self.suffixes, self.lengths, self.offsets = (column[:] for column in table)
+                self.base_size = self.first_code + len(self.dictionary)
+            self.table_key = (self.first_code, dictionary_id)
+        self.reset()
+
+    def reset(self):
+        # Return to the initial dictionary of the stream begin() was last called
+        # for (begin() calls it), to decode another stream with the same settings.
+        # As after a CLEAR, the columns are kept and overwritten from base_size on;
+        # only the trained phrases have to forget where they were last written.
+        if self.base_size > self.first_code:
+            self.offsets[self.first_code:self.base_size] = array('q', [-1]) * (self.base_size - self.first_code)
+        self.dict_size = self.base_size
+        # The code the next new phrase will be stored under, -1 once the table is full
+        self.next_code = self.base_size
+        self.lru = LRUTable(self.base_size, self.active_table_size) if self.active_use_lru else None
+
+        # Start with 9 bits, or as many as the codes of a trained dictionary need
+        self.initial_bits = max(9, min(self.base_size.bit_length(), self.active_max_bits))
+        if self.active_fixedLZW:
+            self.initial_bits = self.active_max_bits
+        self.current_bits = self.initial_bits
+        self.max_dict_size = 2 ** self.current_bits
+
+        self.previous_code = None
+        self.previous_offset = 0
+        self.code_count = 0
+        self.reset_count = 0
+        self.total_length = 0  # Bytes produced by earlier decode() calls
+        if self.profiler is not None:
+            self.profiler.reset()
+
+    def _build_table(self):
+        # The columns for the single bytes and the trained phrases. The phrases
+        # are not in the output yet (offset -1): the first use rebuilds them from
+        # their prefixes, later ones copy them.
+        codes = self.dictionary.codes(self.first_code)
+        prefixes = array('I', bytes(4 * self.first_code)) + array('I', codes)
+        suffixes = array('B', bytes(range(256)) + bytes(self.first_code - 256) + self.dictionary.suffixes)
+        lengths = array('I', [1] * self.first_code)
+        for prefix in codes:
+            lengths.append(lengths[prefix] + 1)
+        offsets = array('q', bytes(8 * self.first_code)) + array('q', [-1]) * len(codes)
+        return prefixes, suffixes, lengths, offsets
+
+    def decode(self, next_code, output, limit=None):
+        # Write the decoded bytes into output starting at index 0 and return how
+        # many were written. output may be preallocated (e.g. to the length in the
+        # header); it is only enlarged when it is too small. With a limit, output
+        # already holds that many bytes and decoding past them is an error
+        # instead, so a caller's buffer is never overrun or resized.
+        profiler = self.profiler
+        if profiler is not None:
+            # Table lookups and output copies are interleaved, so both count as output time
+            next_code = profiler.wrap_decompressor(next_code, self)
+            decode_start = time.perf_counter_ns()
+            packing_start = profiler.packing_time_ns
+        prefixes = self.prefixes
+        suffixes = self.suffixes
+        lengths = self.lengths
+        offsets = self.offsets
+        dict_size = self.dict_size
+        current_bits = self.current_bits
+        max_dict_size = self.max_dict_size
+        max_bits = self.active_max_bits
+        max_table_size = self.active_table_size
+        clear_code = self.clear_code
+        new_code = self.next_code
+        lru = self.lru
+        previous_code = self.previous_code
+        code_count = self.code_count
+
+        # Offsets are absolute positions in the decoded stream; phrases written by
+        # earlier decode() calls are no longer in output and have to be rebuilt
+        base = self.total_length
+        previous_position = self.previous_offset - base
+        position = 0
+        size = len(output) if limit is None else limit
+
+        while True:
+            code = next_code(current_bits)
+            if code is None:
+                break
+            code_count += 1
+
+            if code == clear_code:
+                # Start over with the initial dictionary; the table columns are
+                # kept and simply overwritten from base_size on
+                dict_size = self.base_size
+                new_code = dict_size
+                current_bits = self.initial_bits
+                max_dict_size = 2 ** current_bits
+                previous_code = None
+                if lru is not None:
+                    lru = self.lru = LRUTable(self.base_size, max_table_size)
+                self.reset_count += 1
+                continue
+
+            if previous_code is None:
+                # The first code of the stream (or after a CLEAR) is always in the
+                # initial dictionary: a single byte or a trained phrase
+                if code >= self.base_size:
+                    raise ValueError(f"Invalid code found during decompression: {code}")
+                length = lengths[code]
+                if position + length > size:
+                    size = self._grow(output, length, limit)
+                if code < 256:
+                    output[position] = code
+                else:
+                    self._rebuild(code, output, position)
+                    offsets[code] = base + position
+                previous_code = code
+                previous_position = position
+                position += length
+                continue
+
+            if code == new_code:
+                # Handle the case where the code is not in the dictionary yet (LZW edge case):
+                # the phrase is the previous phrase followed by its own first byte
+                length = lengths[previous_code] + 1
+                if position + length > size:
+                    size = self._grow(output, length, limit)
+
+                if previous_position >= 0:
+                    output[position:position + length - 1] = output[previous_position:previous_position + length - 1]
+                else:
+                    self._rebuild(previous_code, output, position)
+                output[position + length - 1] = output[position]
+            elif code < dict_size:
+                length = lengths[code]
+                if position + length > size:
+                    size = self._grow(output, length, limit)
+
+                if code < 256:
+                    output[position] = code
+                else:
+                    source = offsets[code] - base
+                    if source >= 0:
+                        # The phrase is already in the output, copy it from there
+                        output[position:position + length] = output[source:source + length]
+                    else:
+                        self._rebuild(code, output, position)
+                        offsets[code] = base + position
+            else:
+                raise ValueError(f"Invalid compressed code encountered: {code}")
+
+            # Add the previous phrase extended by the first byte of this one
+            if new_code >= 0:
+                if new_code < len(lengths):
+                    # Slot left over from before a CLEAR, or freed by an eviction
+                    prefixes[new_code] = previous_code
+                    suffixes[new_code] = output[position]
+                    lengths[new_code] = lengths[previous_code] + 1
+                    offsets[new_code] = base + previous_position
+                else:
+                    prefixes.append(previous_code)
+                    suffixes.append(output[position])
+                    lengths.append(lengths[previous_code] + 1)
+                    offsets.append(base + previous_position)
+
+                if lru is not None:
+                    if new_code < dict_size:
+                        lru.evict(new_code)
+                    lru.add(new_code, previous_code, output[position])
+
+                if new_code == dict_size:
+                    dict_size += 1
+
+                    # The compressor always holds one more entry than we do, so widen
+                    # the code size now, before reading the code that may need it
+                    if dict_size >= max_dict_size and current_bits < max_bits:
+                        current_bits += 1
+                        max_dict_size = 2 ** current_bits
+
+            previous_code = code
+            previous_position = position
+            position += length
+
+            if lru is not None:
+                lru.touch(code)
+
+            # Work out where the next phrase goes, exactly as the compressor will
+            if dict_size < max_table_size:
+                new_code = dict_size
+            elif lru is not None:
+                # The compressor evicts its least recently used leaf phrase, except
+                # when that is the phrase it is about to extend (the one just read)
+                new_code = lru.victim()
+                if new_code is None or new_code == code:
+                    new_code = -1
+            else:
+                new_code = -1
+
+        self.dict_size = dict_size
+        self.next_code = new_code
+        self.current_bits = current_bits
+        self.max_dict_size = max_dict_size
+        self.previous_code = previous_code
+        self.previous_offset = base + previous_position
+        self.code_count = code_count
+        self.total_length += position
+        if profiler is not None:
+            profiler.output_time_ns += time.perf_counter_ns() - decode_start - (profiler.packing_time_ns - packing_start)
+        return position
+
+    @staticmethod
+    def _grow(output, length, limit):
+        # Make room for a phrase of length bytes at the end of output, returning its new size
+        if limit is not None:
+            raise ValueError(f"Decompressed data is longer than the header says ({limit} bytes).")
+        output.extend(bytes(max(length, len(output), 4096)))
+        return len(output)
+
+    def _rebuild(self, code, output, position):
+        # Write the phrase of code backwards by following its prefix codes, for
+        # phrases last written by an earlier decode() call
+        prefixes = self.prefixes
+        suffixes = self.suffixes
+        index = position + self.lengths[code] - 1
+        while code >= 256:
+            output[index] = suffixes[code]
+            code = prefixes[code]
+            index -= 1
+        output[index] = code
+
+    def get_memory_usage(self):
+        return deep_sizeof(self.prefixes, self.suffixes, self.lengths, self.offsets, self.lru)
+
+    def verify(self, header, length, checksum):
+        if length != header.original_length:
+            raise ValueError(f"Decompressed length {length} does not match the header ({header.original_length}).")
+        if checksum != header.checksum:
+            raise ValueError("Checksum mismatch: the compressed data is corrupted.")
@@ -0,0 +1,161 @@
+# lzw_dictionary.py
+
+import struct
+from array import array
+from lzw_container import compute_checksum
+
+# A trained dictionary: phrases that LZWCompressor and LZWDecompressor hold from
+# the start (and again after every CLEAR), so short inputs do not have to build
+# up their dictionary from single bytes first. Entries are numbered from 256 and
+# each one is an earlier phrase (a byte, or an earlier entry) plus one byte,
+# exactly like the phrases LZW adds itself; the codec stores entry i under code
+# first_code + i.
+#
+# Layout of a dictionary file:
+#   magic (4 bytes) | version (1) | entry count (4)
+#   prefix of every entry (4 each) | last byte of every entry (1 each)
+# The dictionary ID recorded in .lzw headers is the CRC-32 of the entries.
+DICTIONARY_MAGIC = b'LZWD'
+DICTIONARY_VERSION = 1
+DICTIONARY_HEADER_FORMAT = '<4sBI'
+DICTIONARY_HEADER_SIZE = struct.calcsize(DICTIONARY_HEADER_FORMAT)
+
+DEFAULT_DICTIONARY_SIZE = 1024
+
+class LZWDictionary:
+    def __init__(self, prefixes, suffixes):
+        if len(prefixes) != len(suffixes):
+            raise ValueError("Dictionary prefixes and suffixes differ in length.")
+        pairs = set()
+        for entry, (prefix, suffix) in enumerate(zip(prefixes, suffixes)):
+            # Every prefix must come first, and no phrase twice, or the tries would be corrupted
+            if prefix >= 256 + entry or (prefix, suffix) in pairs:
+                raise ValueError(f"Invalid dictionary entry {entry}.")
+            pairs.add((prefix, suffix))
+
+        self.prefixes = array('I', prefixes)
+        self.suffixes = bytes(suffixes)
+        self.dictionary_id = compute_checksum(self.suffixes, compute_checksum(self._pack_prefixes()))
+        self.cache = {}  # Tables and trie snapshots built from the dictionary, see snapshot()
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    def __getstate__(self):
+        # Worker processes rebuild their own snapshots instead of receiving copies
+        state = self.__dict__.copy()
+        state['cache'] = {}
+        return state
+
+    def _pack_prefixes(self):
+        return struct.pack(f'<{len(self.prefixes)}I', *self.prefixes)
+
+    def pack(self):
+        return struct.pack(DICTIONARY_HEADER_FORMAT, DICTIONARY_MAGIC, DICTIONARY_VERSION, len(self)) + \
+            self._pack_prefixes() + self.suffixes
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < DICTIONARY_HEADER_SIZE:
+            raise ValueError("Data is too short to contain an LZW dictionary.")
+        magic, version, count = struct.unpack_from(DICTIONARY_HEADER_FORMAT, data)
+        if magic != DICTIONARY_MAGIC:
+            raise ValueError("Data is not an LZW dictionary (bad magic number).")
+        if version != DICTIONARY_VERSION:
+            raise ValueError(f"Unsupported LZW dictionary version: {version}")
+        if len(data) != DICTIONARY_HEADER_SIZE + count * 5:
+            raise ValueError("LZW dictionary is truncated or corrupted.")
+        prefixes = struct.unpack_from(f'<{count}I', data, DICTIONARY_HEADER_SIZE)
+        return cls(prefixes, data[DICTIONARY_HEADER_SIZE + count * 4:])
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.pack())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.unpack(file.read())
+
+    def codes(self, first_code):
+        # The prefix of every entry as a code, for entries numbered from first_code
+        return [prefix if prefix < 256 else first_code + prefix - 256 for prefix in self.prefixes]
+
+    def snapshot(self, key, build):
+        # The object cached under key, made by build() the first time. The codec
+        # keeps its initial tables and tries here, so they are built once per
+        # dictionary and configuration and then only copied.
+        value = self.cache.get(key)
+        if value is None:
+            value = self.cache[key] = build()
+        return value
+
+    def fill_trie(self, trie, first_code):
+        # Insert the single bytes and every entry into an empty trie
+        root = trie.root_cursor()
+        cursors = [trie.insert_at(root, byte, byte) for byte in range(256)]
+        for entry, (prefix, suffix) in enumerate(zip(self.prefixes, self.suffixes)):
+            cursors.append(trie.insert_at(cursors[prefix], suffix, first_code + entry))
+
+    def phrases(self, first_code):
+        # The bytes of every code below first_code + len(self), cached
+        def build():
+            phrases = [bytes((byte,)) for byte in range(256)] + [b''] * (first_code - 256)
+            entries = phrases[:256]
+            for prefix, suffix in zip(self.prefixes, self.suffixes):
+                entries.append(entries[prefix] + bytes((suffix,)))
+            return phrases + entries[256:]
+        return self.snapshot(('phrases', first_code), build)
+
+    @classmethod
+    def train(cls, samples, size=DEFAULT_DICTIONARY_SIZE):
+        # Parse every sample with LZW, letting the dictionary grow (up to a limit)
+        # across samples, and keep the size phrases the parse went through most
+        # often. A phrase is passed through at least as often as any longer phrase
+        # starting with it, so the most frequent ones always include their prefixes.
+        #
+        # Nodes of the counting trie are [children, count]
+        byte_nodes = [[{}, 0] for _ in range(256)]
+        node_limit = max(size * 8, 65536)
+        node_count = 0
+        for sample in samples:
+            node = None
+            for byte in bytes(sample):
+                if node is None:
+                    node = byte_nodes[byte]
+                    continue
+                child = node[0].get(byte)
+                if child is not None:
+                    node = child
+                    continue
+                node[1] += 1  # The phrase ends here
+                if node_count < node_limit:
+                    node[0][byte] = [{}, 0]
+                    node_count += 1
+                node = byte_nodes[byte]
+            if node is not None:
+                node[1] += 1
+
+        # (node, parent, byte, depth) of every phrase longer than a byte, parents first
+        candidates = []
+        stack = [(child, parent, byte, 2) for parent in byte_nodes for byte, child in parent[0].items()]
+        while stack:
+            candidate = stack.pop()
+            candidates.append(candidate)
+            node, _, _, depth = candidate
+            stack.extend((child, node, byte, depth + 1) for byte, child in node[0].items())
+        # Add the uses of every phrase to all of its prefixes
+        for node, parent, _, _ in reversed(candidates):
+            parent[1] += node[1]
+
+        # Phrases passed through only once are not worth a code
+        candidates = [candidate for candidate in candidates if candidate[0][1] > 1]
+        candidates.sort(key=lambda candidate: (-candidate[0][1], candidate[3]))
+        references = {id(node): byte for byte, node in enumerate(byte_nodes)}
+        prefixes = []
+        suffixes = bytearray()
+        for node, parent, byte, _ in candidates[:size]:
+            references[id(node)] = 256 + len(prefixes)
+            prefixes.append(references[id(parent)])
+            suffixes.append(byte)
+        return cls(prefixes, suffixes)
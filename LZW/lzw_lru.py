@@ -0,0 +1,92 @@
+# lzw_lru.py
+
+from array import array
+
+NONE = -1
+
+class LRUTable:
+    # Recency order of the leaf phrases of an LZW dictionary, i.e. the phrases no
+    # longer phrase has been built on. Only leaves can be evicted: every prefix of
+    # a phrase in the dictionary must stay in it. The compressor and the
+    # decompressor drive their own copy with the same calls in the same order, so
+    # they always agree on which code is evicted next.
+    #
+    # The leaves form a doubly linked list kept in arrays indexed by code, with the
+    # most recently used leaf at the head, so every operation is O(1).
+    def __init__(self, first_code, table_size, base_phrases=None):
+        self.first_code = first_code  # Codes below this (single bytes, CLEAR, trained phrases) are never evicted
+        self.base_phrases = base_phrases  # The bytes of those codes, if they are not all single bytes
+        self.parents = array('i', [NONE]) * table_size
+        self.suffixes = array('B', bytes(table_size))
+        self.child_counts = array('i', bytes(4 * table_size))
+        self.newer = array('i', [NONE]) * table_size
+        self.older = array('i', [NONE]) * table_size
+        self.linked = array('b', bytes(table_size))
+        self.head = NONE  # Most recently used leaf
+        self.tail = NONE  # Least recently used leaf
+
+    def _link(self, code):
+        # Insert code at the most recently used end
+        self.newer[code] = NONE
+        self.older[code] = self.head
+        if self.head != NONE:
+            self.newer[self.head] = code
+        else:
+            self.tail = code
+        self.head = code
+        self.linked[code] = 1
+
+    def _unlink(self, code):
+        newer = self.newer[code]
+        older = self.older[code]
+        if newer != NONE:
+            self.older[newer] = older
+        else:
+            self.head = older
+        if older != NONE:
+            self.newer[older] = newer
+        else:
+            self.tail = newer
+        self.linked[code] = 0
+
+    def touch(self, code):
+        # Called for every code that is output (or read)
+        if self.linked[code] and self.head != code:
+            self._unlink(code)
+            self._link(code)
+
+    def add(self, code, parent, byte):
+        # A new phrase (parent + byte) was stored under code: it is a leaf, and its
+        # parent no longer is
+        self.parents[code] = parent
+        self.suffixes[code] = byte
+        self.child_counts[code] = 0
+        self._link(code)
+        if parent >= self.first_code:
+            self.child_counts[parent] += 1
+            if self.linked[parent]:
+                self._unlink(parent)
+
+    def victim(self):
+        # The code the next eviction would free, or None if no phrase can be evicted
+        return None if self.tail == NONE else self.tail
+
+    def evict(self, code):
+        self._unlink(code)
+        parent = self.parents[code]
+        if parent >= self.first_code:
+            self.child_counts[parent] -= 1
+            if self.child_counts[parent] == 0:
+                # The parent became a leaf again; treat it as freshly used
+                self._link(parent)
+
+    def sequence(self, code):
+        # Rebuild the bytes of a phrase from the parent links
+        sequence = bytearray()
+        while code >= self.first_code:
+            sequence.append(self.suffixes[code])
+            code = self.parents[code]
+        sequence.reverse()
+        # The rest is a code that is never evicted
+        prefix = bytes((code,)) if self.base_phrases is None else self.base_phrases[code]
+        return prefix + bytes(sequence)
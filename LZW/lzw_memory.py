@@ -0,0 +1,74 @@
+# lzw_memory.py
+
+import sys
+import types
+from array import array
+
+# Objects the interpreter shares between all users (None, booleans, small
+# integers, bytes of length one...) are not part of any one structure, so they
+# are not counted
+_SHARED_TYPES = (type, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.ModuleType)
+
+def _is_shared(obj):
+    if obj is None or obj is True or obj is False:
+        return True
+    if type(obj) is int:
+        return -5 <= obj <= 256
+    if type(obj) is bytes:
+        return len(obj) <= 1
+    return isinstance(obj, _SHARED_TYPES)
+
+_PLAIN_TYPES = (str, bytes, bytearray, memoryview, array, int, float)  # getsizeof includes their payload
+_slot_cache = {}
+
+def _slot_names(cls):
+    names = _slot_cache.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get('__slots__', ())
+            names.extend((slots,) if isinstance(slots, str) else slots)
+        names = _slot_cache[cls] = tuple(name for name in names if name not in ('__dict__', '__weakref__'))
+    return names
+
+def deep_sizeof(*objects):
+    # Total size in bytes of objects and of everything they reference, each object
+    # counted once: containers with their current (over-allocated) capacity, the
+    # buffers of arrays, and the attributes of plain and __slots__ instances.
+    # Iterative, so very deep tries do not hit the recursion limit.
+    getsizeof = sys.getsizeof
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        kind = type(obj)
+        # Fast paths for the objects tries consist of, before the general checks
+        if kind is int:
+            if -5 <= obj <= 256:
+                continue
+        elif kind is dict:
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += getsizeof(obj)
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            continue
+        if _is_shared(obj) or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, _PLAIN_TYPES):
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for name in _slot_names(kind):
+                value = getattr(obj, name, None)
+                if value is not None:
+                    stack.append(value)
+    return total
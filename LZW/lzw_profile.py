@@ -0,0 +1,187 @@
+# lzw_profile.py
+
+import time
+from collections import deque
+
+# Columns added to the stats (and stats.csv) of a profiled run
+PROFILE_FIELDS = ['nodes_per_byte', 'dictionary_hits', 'dictionary_misses', 'width_transitions',
+                  'trie_time', 'packing_time', 'output_time', 'avg_phrase_length']
+
+class LZWProfiler:
+    # Counters for one compression or decompression run. Pass an instance as
+    # profiler= to LZWCompressor or LZWDecompressor: they then route their trie,
+    # bit packing and bit unpacking calls through the timing wrappers below.
+    # Without a profiler nothing is wrapped, so the hot loops run unchanged.
+    #
+    # Subclass and override on_width_change() / on_window() to observe a run as
+    # it happens, e.g. to log or export the values.
+    def __init__(self, window=1024):
+        self.window = window  # Codes per sample of the average phrase length
+        self.reset()
+
+    def reset(self):
+        self.bytes_processed = 0  # Input bytes (compression) or output bytes (decompression)
+        self.nodes_visited = 0
+        self.hits = 0
+        self.misses = 0
+        self.codes = 0
+        self.clear_codes = 0
+        self.width_changes = []  # (offset, new width) for every code width transition
+        self.phrase_samples = []  # (offset, average phrase length over the last window codes)
+        self.trie_time_ns = 0
+        self.packing_time_ns = 0
+        self.output_time_ns = 0
+        self.current_bits = None
+        self.clear_code = None
+        self.phrase_lengths = deque()
+        self.phrase_total = 0
+
+    # Observer interface
+    def on_width_change(self, offset, bits):
+        self.width_changes.append((offset, bits))
+
+    def on_window(self, offset, average):
+        self.phrase_samples.append((offset, average))
+
+    def _code(self, code, bits, phrase_length, offset):
+        # Called for every code written or read; offset is where its phrase starts
+        # in the uncompressed data
+        self.codes += 1
+        if bits != self.current_bits:
+            if self.current_bits is not None:
+                self.on_width_change(offset, bits)
+            self.current_bits = bits
+        if code == self.clear_code:
+            self.clear_codes += 1
+            return
+
+        self.phrase_lengths.append(phrase_length)
+        self.phrase_total += phrase_length
+        if len(self.phrase_lengths) > self.window:
+            self.phrase_total -= self.phrase_lengths.popleft()
+        if (self.codes - self.clear_codes) % self.window == 0:
+            self.on_window(offset + phrase_length, self.phrase_total / len(self.phrase_lengths))
+
+    # Compression: a proxy for the trie and a wrapper for emit()
+    def wrap_compressor(self, trie, emit, clear_code):
+        self.clear_code = clear_code
+        proxy = _ProfiledTrie(trie, self)
+        perf_counter_ns = time.perf_counter_ns
+
+        def profiled_emit(code, bits):
+            start = perf_counter_ns()
+            emit(code, bits)
+            self.packing_time_ns += perf_counter_ns() - start
+            if code == clear_code:
+                self._code(code, bits, 0, proxy.phrase_start)
+                return
+            # A phrase ends either at the byte that missed (which starts the next
+            # phrase) or, from end(), at the end of the input so far
+            phrase_end = self.bytes_processed - 1 if proxy.phrase_missed else self.bytes_processed
+            proxy.phrase_missed = False
+            self._code(code, bits, phrase_end - proxy.phrase_start, proxy.phrase_start)
+            proxy.phrase_start = phrase_end
+        return proxy, profiled_emit
+
+    # Decompression: a wrapper for next_code()
+    def wrap_decompressor(self, next_code, decompressor):
+        clear_code = self.clear_code = decompressor.clear_code
+        perf_counter_ns = time.perf_counter_ns
+        prefixes = decompressor.prefixes
+        lengths = decompressor.lengths
+        # The last two codes read with their widths; a code's table entry is only
+        # complete once the decompressor asks for the code after it
+        history = [None, None]
+
+        def account(code, bits, before):
+            if code == clear_code:
+                self._code(code, bits, 0, self.bytes_processed)
+                return
+            # A phrase built on the code just before it can only be the entry that
+            # was being added (the KwKwK case): anything else would have let the
+            # compressor extend the previous phrase instead
+            if before is not None and before != clear_code and code >= 256 and prefixes[code] == before:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._code(code, bits, lengths[code], self.bytes_processed)
+            self.bytes_processed += lengths[code]
+
+        def profiled_next_code(bits):
+            if history[0] is not None:
+                account(history[0][0], history[0][1], history[1])
+            start = perf_counter_ns()
+            code = next_code(bits)
+            self.packing_time_ns += perf_counter_ns() - start
+            history[1] = None if history[0] is None else history[0][0]
+            history[0] = None if code is None else (code, bits)
+            return code
+        return profiled_next_code
+
+    def summary(self):
+        # The values added to the stats of a profiled run (times in seconds, like
+        # execution_time). A compressor miss is a failed trie step (the end of a
+        # phrase); a decompressor miss is a code that was not in the table yet.
+        return {
+            'nodes_per_byte': self.nodes_visited / self.bytes_processed if self.bytes_processed else 0,
+            'dictionary_hits': self.hits,
+            'dictionary_misses': self.misses,
+            'width_transitions': ' '.join(f"{bits}@{offset}" for offset, bits in self.width_changes),
+            'trie_time': self.trie_time_ns / 1e9,
+            'packing_time': self.packing_time_ns / 1e9,
+            'output_time': self.output_time_ns / 1e9,
+            'avg_phrase_length': sum(self.phrase_lengths) / len(self.phrase_lengths) if self.phrase_lengths else 0
+        }
+
+class _ProfiledTrie:
+    # Stands in for the trie in LZWCompressor: every call is timed, and step()
+    # also counts the input bytes, the nodes visited and the hits and misses
+    def __init__(self, trie, profiler):
+        self.trie = trie
+        self.profiler = profiler
+        self.restep_pending = False  # The last step missed; the next one restarts from the root with the same byte
+        self.phrase_missed = False  # The code about to be written ends at a missed byte
+        self.phrase_start = 0
+
+    def root_cursor(self):
+        return self.trie.root_cursor()
+
+    def step(self, cursor, byte):
+        profiler = self.profiler
+        start = time.perf_counter_ns()
+        next_cursor = self.trie.step(cursor, byte)
+        profiler.trie_time_ns += time.perf_counter_ns() - start
+        profiler.nodes_visited += 1
+        if self.restep_pending:
+            self.restep_pending = False
+            return next_cursor  # The same byte again, after the code for the phrase was written
+        profiler.bytes_processed += 1
+        if next_cursor is None:
+            profiler.misses += 1
+            self.restep_pending = True
+            self.phrase_missed = True
+        else:
+            profiler.hits += 1
+        return next_cursor
+
+    def cursor_index(self, cursor):
+        start = time.perf_counter_ns()
+        index = self.trie.cursor_index(cursor)
+        self.profiler.trie_time_ns += time.perf_counter_ns() - start
+        return index
+
+    def insert_at(self, cursor, byte, index):
+        start = time.perf_counter_ns()
+        node = self.trie.insert_at(cursor, byte, index)
+        self.profiler.trie_time_ns += time.perf_counter_ns() - start
+        return node
+
+    def remove(self, sequence):
+        start = time.perf_counter_ns()
+        self.trie.remove(sequence)
+        self.profiler.trie_time_ns += time.perf_counter_ns() - start
+
+    def reset(self):
+        start = time.perf_counter_ns()
+        self.trie.reset()
+        self.profiler.trie_time_ns += time.perf_counter_ns() - start
@@ -0,0 +1,103 @@
+# lzw_seekable.py
+
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from bit_io import BitReader
+from lzw_decompressor import LZWDecompressor
+from lzw_container import (LZWHeader, HEADER_SIZE, DICTIONARY_ID_SIZE, RESTART_COUNT_FORMAT, RESTART_COUNT_SIZE,
+                           RESTART_ENTRY_SIZE, unpack_restart_index)
+
+class LZWSeekableReader:
+    # Random access to a .lzw container compressed with restart_interval. Every
+    # restart point starts a fresh dictionary at a known bit offset, so a range
+    # is decoded from the last restart point before it up to the first one
+    # after it, and only that part of the container is read.
+    #
+    # source is the container itself (bytes, bytearray, mmap...) or a seekable
+    # binary file object holding it. A container compressed with a trained
+    # dictionary needs that dictionary. A stored container (input that did not
+    # compress) has no index, and a range is simply read from it.
+    def __init__(self, source, dictionary=None):
+        self.source = source
+        self.is_file = hasattr(source, 'read')
+        self.dictionary = dictionary
+
+        self.header = LZWHeader.unpack(self._read(0, HEADER_SIZE + DICTIONARY_ID_SIZE))
+        if self.header.stored:
+            self.payload_start = self.header.size
+            if self._size() < self.payload_start + self.header.original_length:
+                raise ValueError("LZW data is truncated (incomplete stored data).")
+            return
+        if not self.header.indexed:
+            raise ValueError("LZW data has no restart index; compress it with restart_interval to allow random access.")
+
+        index_start = self.header.size
+        count_bytes = self._read(index_start, RESTART_COUNT_SIZE)
+        if len(count_bytes) < RESTART_COUNT_SIZE:
+            raise ValueError("LZW data is truncated (incomplete restart index).")
+        count, = struct.unpack(RESTART_COUNT_FORMAT, count_bytes)
+        index = unpack_restart_index(count_bytes + self._read(index_start + RESTART_COUNT_SIZE, count * RESTART_ENTRY_SIZE), 0)
+        if index is None or count == 0:
+            raise ValueError("LZW data is truncated (incomplete restart index).")
+
+        restart_points, index_size = index
+        self.payload_start = index_start + index_size
+        self.payload_end = self._size()
+        self.original_offsets = [original_offset for original_offset, _ in restart_points]
+        self.bit_offsets = [bit_offset for _, bit_offset in restart_points]
+
+    def _read(self, offset, size):
+        if self.is_file:
+            self.source.seek(offset)
+            return self.source.read(size)
+        return self.source[offset:offset + size]
+
+    def _size(self):
+        if self.is_file:
+            return self.source.seek(0, os.SEEK_END)
+        return len(self.source)
+
+    def __len__(self):
+        return self.header.original_length
+
+    def read_range(self, start, length):
+        # The length bytes of the original data starting at start (fewer if the
+        # range runs past the end)
+        if start < 0 or length < 0:
+            raise ValueError(f"Invalid range: start={start}, length={length}")
+        stop = min(start + length, self.header.original_length)
+        if start >= stop:
+            return bytearray()
+        if self.header.stored:
+            return bytearray(self._read(self.payload_start + start, stop - start))
+
+        # Segments first..last-1 cover the range; restart point last (if any) ends it
+        first = bisect_right(self.original_offsets, start) - 1
+        last = bisect_left(self.original_offsets, stop)
+        segment_start = self.original_offsets[first]
+        if last < len(self.original_offsets):
+            segment_stop = self.original_offsets[last]
+            bit_stop = self.bit_offsets[last]
+        else:
+            segment_stop = self.header.original_length
+            bit_stop = (self.payload_end - self.payload_start) * 8
+
+        # Read whole bytes; the few extra bits at either end never form a complete code
+        bit_start = self.bit_offsets[first]
+        data = self._read(self.payload_start + (bit_start >> 3), ((bit_stop + 7) >> 3) - (bit_start >> 3))
+        reader = BitReader(data)
+        if bit_start & 7:
+            reader.read(bit_start & 7)
+
+        decompressor = LZWDecompressor(dictionary=self.dictionary)
+        decompressor.begin(self.header.max_bits, self.header.fixedLZW, self.header.use_clear_code, self.header.use_lru,
+                           self.header.dictionary_id)
+        output = bytearray(segment_stop - segment_start)
+        written = decompressor.decode(reader.read, output)
+        if written != segment_stop - segment_start:
+            raise ValueError("Compressed data is corrupted (restart segment has the wrong length).")
+
+        del output[stop - segment_start:]
+        del output[:start - segment_start]
+        return output
@@ -0,0 +1,243 @@
+# lzw_stream.py
+
+from bit_io import BitReader
+from lzw_compressor import LZWCompressor, STORE_SAMPLE_SIZE
+from lzw_decompressor import LZWDecompressor
+from range_coder import RangeCodeReader, START_BYTES
+from lzw_container import LZWHeader, HEADER_SIZE, TRAILER_SIZE, compute_checksum, header_size, unpack_restart_index
+
+# Default amount of input read per step by compress_stream / decompress_stream
+CHUNK_SIZE = 1 << 20
+
+class LZWStreamCompressor:
+    # Incremental compressor: feed() chunks and concatenate everything returned
+    # by feed() and flush() to get a .lzw container. Only the dictionary and the
+    # bits of the last unfinished byte are kept between calls.
+    #
+    # With store_incompressible, nothing is output until the first
+    # STORE_SAMPLE_SIZE bytes have been encoded: if their codes are larger than
+    # they are, the stream is stored instead (see lzw_compressor.py) and the
+    # input is passed through from then on.
+    def __init__(self, max_bits=12, use_compact_trie=False, fixedLZW=False, trie=None,
+                 reset_policy='none', reset_window=10000, reset_threshold=0.1, dictionary=None, entropy=False,
+                 store_incompressible=True):
+        self.compressor = LZWCompressor(max_bits=max_bits, use_compact_trie=use_compact_trie, fixedLZW=fixedLZW, trie=trie,
+                                        reset_policy=reset_policy, reset_window=reset_window, reset_threshold=reset_threshold,
+                                        dictionary=dictionary, entropy=entropy, store_incompressible=store_incompressible)
+        self.writer = self.compressor.new_writer()
+        self.compressor.begin(self.writer.write)
+        self.original_length = 0
+        self.checksum = compute_checksum(b'')
+        self.header_written = False
+        self.sample = bytearray() if store_incompressible else None  # Input held back until the decision
+        self.stored = False
+
+    def feed(self, chunk):
+        self.original_length += len(chunk)
+        self.checksum = compute_checksum(chunk, self.checksum)
+        if self.sample is not None:
+            self.sample += chunk
+            if len(self.sample) < STORE_SAMPLE_SIZE:
+                return b''
+            chunk = self._end_sample()
+        if self.stored:
+            return self._take_output(chunk)
+        self.compressor.encode(chunk)
+        return self._take_output()
+
+    def _end_sample(self):
+        # Encode the sample and decide whether to store the stream; returns the
+        # input that followed it (all the input held back if it is stored)
+        data = bytes(self.sample)
+        self.sample = None
+        self.compressor.encode(data[:STORE_SAMPLE_SIZE])
+        if self.writer.get_bit_length() > STORE_SAMPLE_SIZE * 8:
+            self.stored = True
+            self.writer.drain()
+            return data
+        return data[STORE_SAMPLE_SIZE:]
+
+    def flush(self, trailer=True):
+        # Finish the stream. The header written up front cannot hold the length and
+        # checksum yet, so by default they follow as a trailer; pass trailer=False
+        # when the caller will overwrite the header with final_header() instead.
+        if self.sample is not None:
+            # The whole input is shorter than a sample: decide as compress() does
+            data = bytes(self.sample)
+            self.sample = None
+            self.compressor.encode(data)
+            self.stored = self.writer.get_bit_length() > len(data) * 8
+            if not self.stored:
+                self.compressor.end()
+                # Compare the containers, as the header sizes may differ
+                self.stored = self._header().size + len(self.writer.flush()) > HEADER_SIZE + len(data)
+            if self.stored:
+                self.writer.drain()
+                output = self._take_output(data)
+            else:
+                output = self._take_output()
+        elif self.stored:
+            output = self._take_output(b'')
+        else:
+            self.compressor.end()
+            self.writer.flush()
+            output = self._take_output()
+        if trailer:
+            output += self.final_header().pack_trailer()
+        return output
+
+    def final_header(self):
+        # The header of the equivalent one-shot container
+        return self._header(original_length=self.original_length, checksum=self.checksum)
+
+    def _header(self, **fields):
+        if self.stored:
+            return LZWHeader(self.compressor.max_bits, stored=True, **fields)
+        return LZWHeader(self.compressor.max_bits, self.compressor.fixedLZW,
+                         use_clear_code=self.compressor.use_clear_code, use_lru=self.compressor.use_lru,
+                         dictionary_id=self.compressor.dictionary_id, entropy=self.compressor.entropy, **fields)
+
+    def _take_output(self, data=None):
+        # The codes written so far, or data for a stored stream, after the header
+        # if it has not been output yet
+        output = self.writer.drain() if data is None else bytes(data)
+        if not self.header_written:
+            output = self._header(streamed=True).pack() + output
+            self.header_written = True
+        return output
+
+class LZWStreamDecompressor:
+    # Incremental decompressor for .lzw containers produced by either the one-shot
+    # or the streaming compressor. feed() returns the bytes decoded so far.
+    def __init__(self, dictionary=None):
+        self.decompressor = LZWDecompressor(dictionary=dictionary)
+        self.pending = bytearray()
+        self.header = None
+        self.reader = None
+        self.original_length = 0
+        self.checksum = compute_checksum(b'')
+
+    def feed(self, chunk):
+        self.pending += chunk
+        output = bytearray()
+
+        if self.header is None:
+            size = header_size(self.pending)
+            if size is None or len(self.pending) < size:
+                return output
+            self.header = LZWHeader.unpack(self.pending)
+            del self.pending[:size]
+
+        if self.header.stored:
+            # The data itself, up to the trailer
+            end = max(len(self.pending) - (TRAILER_SIZE if self.header.streamed else 0), 0)
+            output += self.pending[:end]
+            del self.pending[:end]
+            self.original_length += len(output)
+            self.checksum = compute_checksum(output, self.checksum)
+            return output
+
+        if self.reader is None:
+            start = self._code_start()
+            # The range decoder starts from its first bytes
+            if start is None or (self.header.entropy and self._code_end() - start < START_BYTES):
+                return output
+            self._begin_reader(start, final=False)
+        return self._decode(output)
+
+    def _code_start(self):
+        # Where the codes start in pending: after the restart index, which is only
+        # needed for random access; None while it is incomplete
+        if not self.header.indexed:
+            return 0
+        index = unpack_restart_index(self.pending, 0)
+        return None if index is None else index[1]
+
+    def _code_end(self):
+        # The last bytes of a streamed container may be its trailer, keep them back
+        return max(len(self.pending) - (TRAILER_SIZE if self.header.streamed else 0), 0)
+
+    def _begin_reader(self, start, final):
+        del self.pending[:start]
+        self.decompressor.begin(self.header.max_bits, self.header.fixedLZW,
+                                self.header.use_clear_code, self.header.use_lru, self.header.dictionary_id)
+        if self.header.entropy:
+            # Stops short of end while a code might need bytes that have not arrived
+            self.reader = RangeCodeReader(self.header.max_bits, self.pending, 0, self._code_end(), final)
+        else:
+            self.reader = BitReader(self.pending, 0, 0)
+
+    def _decode(self, output):
+        # Decode the codes that have arrived in pending into output
+        self.reader.end = self._code_end()
+        written = self.decompressor.decode(self.reader.read, output)
+        del output[written:]
+
+        # Drop the bytes that have been moved into the reader's accumulator
+        del self.pending[:self.reader.position]
+        self.reader.position = 0
+
+        self.original_length += len(output)
+        self.checksum = compute_checksum(output, self.checksum)
+        return output
+
+    def flush(self):
+        # Check that the stream was complete and intact
+        if self.header is None:
+            raise ValueError("Data is too short to contain an LZW header.")
+        output = bytearray()
+        if self.header.entropy:
+            # Decode the codes kept back in case they ran on into more input
+            if self.header.streamed and len(self.pending) < TRAILER_SIZE:
+                raise ValueError("Streamed LZW data is truncated (missing trailer).")
+            if self.reader is None:
+                start = self._code_start()
+                if start is not None:
+                    self._begin_reader(start, final=True)
+            else:
+                self.reader.final = True
+            if self.reader is not None:
+                output = self._decode(output)
+        if self.reader is None and not self.header.stored:
+            raise ValueError("LZW data is truncated (incomplete restart index).")
+        if self.header.streamed:
+            self.header.unpack_trailer(self.pending)
+        if not self.header.stored and self.decompressor.code_count == 0 and self.header.original_length:
+            raise ValueError("Compressed data is empty; nothing to decompress.")
+        self.decompressor.verify(self.header, self.original_length, self.checksum)
+        return output
+
+def compress_stream(src, dst, chunk_size=CHUNK_SIZE, **options):
+    # Compress the binary file object src into dst; options are the LZWCompressor
+    # arguments. If dst is seekable the header is rewritten at the end, giving
+    # exactly the same bytes as the one-shot path (unless only the whole input
+    # turns out to be incompressible: by then the stream's codes are written, and
+    # only the one-shot path can still store it).
+    stream = LZWStreamCompressor(**options)
+    seekable = dst.seekable() if hasattr(dst, 'seekable') else False
+    start = dst.tell() if seekable else 0
+
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        dst.write(stream.feed(chunk))
+    dst.write(stream.flush(trailer=not seekable))
+
+    if seekable:
+        end = dst.tell()
+        dst.seek(start)
+        dst.write(stream.final_header().pack())
+        dst.seek(end)
+    return stream.original_length
+
+def decompress_stream(src, dst, chunk_size=CHUNK_SIZE, dictionary=None):
+    # Decompress the binary file object src into dst, returning the number of bytes written
+    stream = LZWStreamDecompressor(dictionary)
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        dst.write(stream.feed(chunk))
+    dst.write(stream.flush())
+    return stream.original_length
@@ -1,59 +1,380 @@
 import sys
 import argparse
-import nltk
-from nltk.corpus import gutenberg
-from lzw_compressor import LZWCompressor
-from lzw_decompressor import LZWDecompressor
-from plot import generate_graphs
 import csv
-import pandas as pd
 import os
+import mmap
+from lzw_compressor import LZWCompressor, TRIE_TYPES, RESET_POLICIES
+from lzw_decompressor import LZWDecompressor
+from lzw_stream import LZWStreamDecompressor, compress_stream, CHUNK_SIZE
+from lzw_blocks import LZWBlockCompressor, LZWBlockDecompressor, BLOCK_MAGIC, run_ordered
+from lzw_dictionary import LZWDictionary, DEFAULT_DICTIONARY_SIZE
+from lzw_profile import LZWProfiler, PROFILE_FIELDS
+from lzw_cache import LZWCache, CACHE_FIELDS, DEFAULT_CACHE_BYTES
+from range_coder import MAX_ENTROPY_BITS
+from lzw_auto import choose_options, GOALS, AUTO_FIELDS, AUTO_SAMPLE_SIZE, MIN_AUTO_BITS, UNKNOWN_LENGTH
+
+# nltk (for the Gutenberg corpus) and plot (matplotlib and pandas) are only
+# imported by the test mode that needs them, so compress / decompress start fast
+# and work offline
+
+ALL_FILES = -1  # --test without a number
 
 def text_to_bytes(text):
     """Convert text to bytes using UTF-8 encoding."""
     return text.encode('utf-8')
 
-def bytes_to_text(byte_sequence):
-    """Convert bytes to text using UTF-8 decoding."""
-    return byte_sequence.decode('utf-8')
+def open_input(path):
+    """Open a file for binary reading; '-' is standard input."""
+    return sys.stdin.buffer if path == '-' else open(path, 'rb', buffering=CHUNK_SIZE)
 
-def main():
-    # Download the Gutenberg corpus
-    nltk.download('gutenberg')
-    file_ids = gutenberg.fileids()
+def open_output(path):
+    """Open a file for binary writing; '-' is standard output."""
+    return sys.stdout.buffer if path == '-' else open(path, 'wb', buffering=CHUNK_SIZE)
+
+def map_input(src):
+    """Memory-map src if it is a regular file at its start, so it is used without being read into memory; None otherwise."""
+    try:
+        if src.tell() == 0:
+            return mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        pass  # A pipe, a terminal or an empty file
+    return None
+
+class SampledInput:
+    """A binary input whose first size bytes are read ahead into sample (for --auto on a pipe); read() still returns them first."""
+    def __init__(self, src, size):
+        self.src = src
+        self.sample = src.read(size)
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self.sample[self.position:] if size < 0 else self.sample[self.position:self.position + size]
+        self.position += len(data)
+        if size < 0 or len(data) < size:
+            # Whole reads, like the file object underneath
+            data += self.src.read(-1 if size < 0 else size - len(data))
+        return data
+
+def load_dictionary(path):
+    """The trained dictionary stored at path, or None without a path."""
+    return None if path is None else LZWDictionary.load(path)
+
+def auto_options(args, sample, length, dictionary):
+    """The max_bits, fixedLZW and trie that --auto picks for an input of length bytes starting with sample, and the predicted ratio."""
+    if args.block_size:
+        length = min(length, args.block_size)  # Every block starts a new dictionary
+    min_bits = (256 + len(dictionary)).bit_length() if dictionary is not None else MIN_AUTO_BITS
+    memory_limit = args.memory_limit << 20 if args.memory_limit else None
+    return choose_options(sample, length, args.auto, memory_limit, min_bits)
+
+def train_command(args):
+    samples = []
+    for path in args.samples:
+        with open(path, 'rb') as file:
+            samples.append(file.read())
+    dictionary = LZWDictionary.train(samples, args.size)
+    dictionary.save(args.output)
+    print(f"Saved {len(dictionary)} phrases to {args.output} (dictionary ID {dictionary.dictionary_id:08x})", file=sys.stderr)
+
+def compress_command(args):
+    options = dict(max_bits=args.max_bits, fixedLZW=args.fixed, trie=args.trie, reset_policy=args.reset,
+                   dictionary=load_dictionary(args.dictionary), entropy=args.entropy, store_incompressible=not args.no_store)
+    src = open_input(args.input)
+    dst = open_output(args.output)
+    try:
+        reader = src
+        if args.auto:
+            # A file is sampled through its mapping; a pipe has its first bytes
+            # read ahead and is planned for as large unless it ends within them
+            data = map_input(src)
+            if data is not None:
+                sample, length = data[:AUTO_SAMPLE_SIZE], len(data)
+            else:
+                reader = SampledInput(src, AUTO_SAMPLE_SIZE)
+                sample = reader.sample
+                length = len(sample) if len(sample) < AUTO_SAMPLE_SIZE else UNKNOWN_LENGTH
+            chosen, predicted_ratio = auto_options(args, sample, length, options['dictionary'])
+            options.update(chosen)
+            print(f"Auto ({args.auto}): max_bits={chosen['max_bits']}, {'fixed' if chosen['fixedLZW'] else 'variable'} width, "
+                  f"{chosen['trie']} trie, predicted ratio {predicted_ratio:.3f}", file=sys.stderr)
+
+        if args.block_size:
+            LZWBlockCompressor(args.block_size, args.workers, restart_interval=args.restart_interval, **options).compress_stream(reader, dst)
+        elif args.restart_interval:
+            # The restart index goes in front of the code stream, so this needs the whole input
+            data = map_input(src)
+            if data is None:
+                data = reader.read()
+            dst.write(LZWCompressor(restart_interval=args.restart_interval, **options).compress(data, packed=True))
+        else:
+            compress_stream(reader, dst, **options)
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is sys.stdout.buffer:
+            dst.flush()
+        else:
+            dst.close()
+
+def decompress_command(args):
+    dictionary = load_dictionary(args.dictionary)
+    src = open_input(args.input)
+    dst = open_output(args.output)
+    try:
+        # Block archives and .lzw containers are told apart by their magic number
+        mapped = map_input(src)
+        head = src.read(len(BLOCK_MAGIC)) if mapped is None else mapped[:len(BLOCK_MAGIC)]
+        if head == BLOCK_MAGIC:
+            # The block index is at the end, so the whole archive is needed
+            dst.write(LZWBlockDecompressor(args.workers, dictionary).decompress(head + src.read() if mapped is None else mapped))
+        else:
+            stream = LZWStreamDecompressor(dictionary)
+            chunk = head if mapped is None else src.read(CHUNK_SIZE)
+            while chunk:
+                dst.write(stream.feed(chunk))
+                chunk = src.read(CHUNK_SIZE)
+            dst.write(stream.flush())
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+        if dst is sys.stdout.buffer:
+            dst.flush()
+        else:
+            dst.close()
+
+STATS_FILE = "stats.csv"
+STATS_FIELDS = ['operation', 'ratio', 'dictionary_size', 'memory_usage', 'peak_memory_usage', 'execution_time', 'bits_used',
+                'block_size', 'block_count', 'trie_type', 'text_length', 'file_id', 'max_bits']
+# The codec settings of every row, so --resume only skips the tests run with the same ones
+SETTINGS_FIELDS = ['fixed', 'reset_policy', 'restart_interval', 'entropy', 'dictionary_id', 'store_incompressible']
+RESUME_FIELDS = ['block_size', 'reset_policy', 'restart_interval', 'entropy', 'dictionary_id', 'store_incompressible']
+
+_test_cache = None
+
+def test_cache(size, directory):
+    """The result cache of this process for --cache, created on first use (every --jobs worker has its own)."""
+    global _test_cache
+    if _test_cache is None:
+        _test_cache = LZWCache(size << 20, directory)
+    return _test_cache
+
+def codec_settings(args, dictionary):
+    """The SETTINGS_FIELDS of the rows of a test run with args."""
+    return {'fixed': args.fixed, 'reset_policy': args.reset, 'restart_interval': args.restart_interval, 'entropy': args.entropy,
+            'dictionary_id': None if dictionary is None else f"{dictionary.dictionary_id:08x}", 'store_incompressible': not args.no_store}
+
+def run_test(test, args, dictionary):
+    """Compress and decompress one input with one trie type (in a worker process with --jobs); returns both stats rows, the file ID, whether the round trip succeeded and the cache counts it added."""
+    file_id, file_label, length_label, trie_type, byte_sequence = test
+    cache = test_cache(args.cache_size, args.cache_dir) if args.cache or args.cache_dir else None
+    counters_before = cache.counters() if cache is not None else {}
+    max_bits, fixed = args.max_bits, args.fixed
+    settings = codec_settings(args, dictionary)
+    if args.auto:
+        # Settings picked for this input replace --max-bits, --fixed and the trie type
+        chosen, predicted_ratio = auto_options(args, byte_sequence, len(byte_sequence), dictionary)
+        max_bits, fixed, trie_type = chosen['max_bits'], chosen['fixedLZW'], chosen['trie'].capitalize()
+        settings.update(fixed=fixed, auto_goal=args.auto, memory_limit=args.memory_limit, predicted_ratio=predicted_ratio)
+
+    # Step 1: Compress the Byte Sequence Using LZW into a packed .lzw container
+    if args.block_size:
+        compressor = LZWBlockCompressor(args.block_size, args.workers, max_bits=max_bits, fixedLZW=fixed,
+                                        trie=trie_type.lower(), reset_policy=args.reset,
+                                        restart_interval=args.restart_interval, dictionary=dictionary, cache=cache,
+                                        entropy=args.entropy, store_incompressible=not args.no_store)
+        compressed_data, compress_stats = compressor.compress(byte_sequence, generate_stats=True)
+    else:
+        compressor = LZWCompressor(max_bits=max_bits, fixedLZW=fixed, trie=trie_type.lower(), reset_policy=args.reset,
+                                   restart_interval=args.restart_interval, profiler=LZWProfiler() if args.profile else None,
+                                   dictionary=dictionary, cache=cache, entropy=args.entropy,
+                                   store_incompressible=not args.no_store)
+        compressed_data, compress_stats = compressor.compress(byte_sequence, generate_stats=True, packed=True)
+        compress_stats.update(block_size=0, block_count=1)
+
+    # Step 2: Decompress the Data Using LZW
+    if args.block_size:
+        decompressor = LZWBlockDecompressor(args.workers, dictionary, cache)
+        decompressed_bytes, decompress_stats = decompressor.decompress(compressed_data, generate_stats=True)
+    else:
+        decompressor = LZWDecompressor(max_bits=max_bits, fixedLZW=fixed, profiler=LZWProfiler() if args.profile else None,
+                                       dictionary=dictionary, cache=cache)
+        decompressed_bytes, decompress_stats = decompressor.decompress(compressed_data, generate_stats=True, packed=True)
+        decompress_stats.update(block_size=0, block_count=1)
+
+    for stats in (compress_stats, decompress_stats):
+        stats.update(trie_type=trie_type, text_length=length_label, file_id=file_label, max_bits=max_bits, **settings)
+
+    counters = {name: value - counters_before[name] for name, value in cache.counters().items()} if cache is not None else {}
+    # Step 3: Verify if the decompressed bytes match the original ones
+    return compress_stats, decompress_stats, file_id, byte_sequence == decompressed_bytes, counters
+
+def read_stats(path):
+    """The field names and rows of an earlier stats file."""
+    with open(path, mode='r', newline='') as csv_file:
+        reader = csv.DictReader(csv_file)
+        rows = list(reader)
+        return reader.fieldnames or STATS_FIELDS, rows
+
+def csv_text(value):
+    """value as the csv module writes it."""
+    return '' if value is None else str(value)
 
+def test_key(row):
+    """The test a stats row (as text) belongs to: its input, trie type, max_bits and codec settings; --auto tests by their goal and memory limit instead of what was picked."""
+    if row.get('auto_goal'):
+        picked = ('Auto', row.get('auto_goal'), row.get('memory_limit'))
+    else:
+        picked = (row.get('trie_type'), row.get('max_bits'), row.get('fixed'))
+    return (row.get('file_id'), row.get('text_length')) + picked + tuple(row.get(name) for name in RESUME_FIELDS)
+
+def recorded_tests(rows):
+    """The test_key() of the tests that have both their rows in rows."""
+    operations = {}
+    for row in rows:
+        operations.setdefault(test_key(row), set()).add(row.get('operation'))
+    return {key for key, recorded in operations.items() if {'compression', 'decompression'} <= recorded}
+
+def parse_value(text):
+    """A stats value read back from the CSV file as a number where it is one."""
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except (TypeError, ValueError):
+            pass
+    return None if text == '' else text
+
+def add_codec_options(parser, keep_defaults=True):
+    """Add the options shared by the test mode and the compress subcommand; without keep_defaults they stay unset unless given, so a subcommand keeps the values given before it."""
+    def default(value):
+        return value if keep_defaults else argparse.SUPPRESS
+    parser.add_argument('--fixed', action='store_true', default=default(False), help="Use fixed LZW bit length")
+    parser.add_argument('--max-bits', type=int, help="Maximum number of bits", default=default(12))
+    parser.add_argument('--reset', choices=RESET_POLICIES, default=default('none'), help="Dictionary reset / eviction policy once the table is full")
+    parser.add_argument('--restart-interval', type=int, default=default(None), help="Add a restart point every this many input bytes, for random access")
+    parser.add_argument('--block-size', type=int, default=default(None), help="Compress independent blocks of this many bytes in parallel")
+    parser.add_argument('--workers', type=int, default=default(None), help="Worker processes for --block-size (default: one per CPU)")
+    parser.add_argument('--dictionary', type=str, default=default(None), help="Start from a trained dictionary file (see the train command)")
+    parser.add_argument('--entropy', action='store_true', default=default(False), help="Range-code the LZW codes with an adaptive model (smaller, slower)")
+    parser.add_argument('--no-store', action='store_true', default=default(False), help="Encode input that LZW expands instead of storing it as it is")
+    parser.add_argument('--auto', choices=GOALS, default=default(None), help="Pick --max-bits, --fixed and the trie backend for each input from a sample of it, for the best ratio or speed")
+    parser.add_argument('--memory-limit', type=int, default=default(None), help="With --auto, keep the dictionary under this many MiB")
+
+def main():
     # Set up command-line arguments
     parser = argparse.ArgumentParser(description="LZW Compression and Decompression with Compact and Standard Tries")
+    add_codec_options(parser)
     parser.add_argument('--compact', action='store_true', help="Use Compact Trie for LZW")
-    parser.add_argument('--fixed', action='store_true', help="Use fixed LZW bit length")
-    parser.add_argument('--max-bits', type=int, help="Maximum number of bits", default=12)
+    parser.add_argument('--trie', action='append', choices=TRIE_TYPES, help="Also run this trie backend (can be repeated)")
 
-    parser.add_argument('--test', nargs='?', const=len(file_ids), type=int, help="Run tests on the entire Gutenberg corpus or the first X number of files")
-    parser.add_argument('--file', type=str, help="Path to a specific .txt file to use")
+    parser.add_argument('--test', nargs='?', const=ALL_FILES, type=int, help="Run tests on the entire Gutenberg corpus or the first X number of files")
+    parser.add_argument('--file', type=str, help="Path to a specific file to use")
     parser.add_argument('--input', type=str, help="Input string to compress and decompress")
 
     parser.add_argument('--stats', action='store_true', help="Save statistics in stats.csv")
+    parser.add_argument('--profile', action='store_true', help="Collect hot-path counters (adds columns to stats.csv)")
     parser.add_argument('--plot', action='store_true', help="Generate statistics graphs")
+    parser.add_argument('--cache', action='store_true', help="Reuse the results of identical runs (adds columns to stats.csv)")
+    parser.add_argument('--cache-dir', type=str, help="Also keep cached results in this directory, for later runs (implies --cache)")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_BYTES >> 20, help="Memory for cached results, in MiB")
+    parser.add_argument('--jobs', type=int, default=1, help="Run the tests in this many worker processes (rows keep their order)")
+    parser.add_argument('--resume', action='store_true', help="Append to stats.csv, skipping the tests it already has (implies --stats)")
+
+    # Subcommands working on raw bytes, for use as a filter in pipelines
+    subcommands = parser.add_subparsers(dest='command', metavar='{compress,decompress,train}')
+    # A subparser sets its defaults over the values parsed before it, so its
+    # copies of options the main parser also has are left unset unless given
+    compress_parser = subcommands.add_parser('compress', help="Compress IN into OUT ('-' for stdin / stdout)")
+    add_codec_options(compress_parser, keep_defaults=False)
+    compress_parser.add_argument('input', metavar='IN')
+    compress_parser.add_argument('output', metavar='OUT')
+    compress_parser.add_argument('--trie', choices=TRIE_TYPES, default=argparse.SUPPRESS, help="Trie backend (default: standard)")
+    decompress_parser = subcommands.add_parser('decompress', help="Decompress IN into OUT ('-' for stdin / stdout)")
+    decompress_parser.add_argument('input', metavar='IN')
+    decompress_parser.add_argument('output', metavar='OUT')
+    decompress_parser.add_argument('--workers', type=int, default=argparse.SUPPRESS, help="Worker processes for block archives (default: one per CPU)")
+    decompress_parser.add_argument('--dictionary', type=str, default=argparse.SUPPRESS, help="The dictionary file the data was compressed with")
+    train_parser = subcommands.add_parser('train', help="Train a dictionary for small inputs from sample files")
+    train_parser.add_argument('samples', metavar='SAMPLE', nargs='+')
+    train_parser.add_argument('-o', '--output', required=True, help="Dictionary file to write")
+    train_parser.add_argument('--size', type=int, default=DEFAULT_DICTIONARY_SIZE, help="Number of phrases to keep")
 
     args = parser.parse_args()
+    if args.memory_limit is not None and not args.auto:
+        parser.error("--memory-limit needs --auto")
+    if args.command == 'compress' and not isinstance(args.trie, str):
+        # Unset, or given before the subcommand, where it can be repeated
+        if args.trie and len(args.trie) > 1:
+            parser.error("compress takes a single --trie")
+        args.trie = args.trie[0] if args.trie else 'standard'
+    if args.command is not None:
+        try:
+            if args.command == 'compress':
+                compress_command(args)
+            elif args.command == 'decompress':
+                decompress_command(args)
+            else:
+                train_command(args)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.profile and args.block_size:
+        parser.error("--profile cannot be combined with --block-size (blocks run in worker processes)")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.entropy and (args.restart_interval or args.max_bits > MAX_ENTROPY_BITS):
+        parser.error(f"--entropy needs --max-bits {MAX_ENTROPY_BITS} or less and cannot be combined with --restart-interval")
+
+    try:
+        dictionary = load_dictionary(args.dictionary)
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not load the dictionary: {e}")
+        sys.exit(1)
+
+    # The matrix runs in this process, or in --jobs worker processes which each
+    # keep their own cache; the cache is created here first to report a bad directory
+    if args.cache or args.cache_dir:
+        try:
+            test_cache(args.cache_size, args.cache_dir)
+        except OSError as e:
+            print(f"Error: Could not create the cache directory: {e}")
+            sys.exit(1)
+    if args.jobs > 1:
+        args.workers = 1  # Blocks are compressed one at a time inside every job
 
     use_compact = args.compact
-    fixed_lzw = args.fixed
+    trie_types = ["Standard"]
+    if use_compact:
+        trie_types.append("Compact")
+    for trie_name in args.trie or []:
+        if trie_name.capitalize() not in trie_types:
+            trie_types.append(trie_name.capitalize())
+    if args.auto:
+        trie_types = ["Auto"]  # Replaced by the backend picked for each input
     max_bits = args.max_bits
     
-    generate_stats = args.stats
+    generate_stats = args.stats or args.resume
     plot_graphs = args.plot
 
     # Determine the source of the input data
+    file_ids = []
     if args.test is not None:
+        # Download the Gutenberg corpus
+        import nltk
+        from nltk.corpus import gutenberg
+        nltk.download('gutenberg')
+        file_ids = gutenberg.fileids()
+
         # Run tests on the first X number of Gutenberg files or all files if no number is specified
         num_files = args.test
-        test_files = file_ids[:num_files]
+        test_files = file_ids if num_files == ALL_FILES else file_ids[:num_files]
     elif args.file:
-        # Read text from a provided .txt file
+        # Use the raw bytes of the provided file, so any file can be used; only
+        # the prefixes tested below are copied out of the mapping
         try:
-            with open(args.file, 'r', encoding='utf-8') as file:
-                file_content = file.read()
+            with open(args.file, 'rb') as file:
+                file_content = map_input(file) or file.read()
             test_files = [(args.file, file_content)]
         except FileNotFoundError:
             print(f"Error: The file '{args.file}' was not found.")
@@ -74,73 +395,92 @@ def main():
         'Medium (100 - 1000 chars)': 1000,
         'Long (1000 - 10000 chars)': 10000,
         'Huge (10000 - 100000 chars)': 100000
-    }
+    }  # Bytes rather than chars for --file
 
     # Create a list to store all the statistics from each test
     all_stats = []
 
-    # Process each file or input
-    for input_info in test_files:
-        file_id, raw_text = (input_info, gutenberg.raw(input_info)) if input_info in file_ids else input_info
-
-        for length_label, length in length_tests.items():
-            # Use only a portion of the text based on the length label
-            test_text = raw_text[:length]
-
-            # Convert text to bytes
-            byte_sequence = text_to_bytes(test_text)
-
-            # Run tests for Standard and optionally for Compact Trie
-            for trie_type in ["Standard", "Compact"]:
-                if trie_type == "Compact" and not use_compact:
-                    continue  # Skip if --compact is not set
-
-                use_compact_trie = trie_type == "Compact"
-
-                # Step 1: Compress the Byte Sequence Using LZW
-                compressor = LZWCompressor(max_bits=max_bits, use_compact_trie=use_compact_trie, fixedLZW=fixed_lzw)
-                compressed_data, compress_stats = compressor.compress(byte_sequence, generate_stats=True)
-                compress_stats['trie_type'] = trie_type
-                compress_stats['text_length'] = length_label.split(' ')[0]
-                compress_stats['file_id'] = os.path.basename(file_id).split('.')[0] if args.file else file_id
+    # Rows are appended to stats.csv as the tests finish, so an interrupted run
+    # keeps what it did; --resume skips the tests already recorded there
+    fieldnames = (STATS_FIELDS + SETTINGS_FIELDS + (PROFILE_FIELDS if args.profile else [])
+                  + (CACHE_FIELDS if args.cache or args.cache_dir else []) + (AUTO_FIELDS if args.auto else []))
+    recorded = set()
+    csv_file = writer = None
+    if generate_stats:
+        try:
+            if args.resume and os.path.exists(STATS_FILE):
+                fieldnames, rows = read_stats(STATS_FILE)
+                # Without the settings its tests were run with, none of them can be told apart from this run's
+                missing = [name for name in SETTINGS_FIELDS + RESUME_FIELDS + (AUTO_FIELDS if args.auto else [])
+                           if name not in fieldnames]
+                if missing:
+                    print(f"Error: {STATS_FILE} has no {', '.join(dict.fromkeys(missing))} column(s) to resume by; "
+                          f"move it away or run without --resume.")
+                    sys.exit(1)
+                recorded = recorded_tests(rows)
+                all_stats = [{name: parse_value(value) for name, value in row.items()} for row in rows]
+                csv_file = open(STATS_FILE, mode='a', newline='')
+                writer = csv.DictWriter(csv_file, fieldnames=fieldnames, extrasaction='ignore')
+            else:
+                csv_file = open(STATS_FILE, mode='w', newline='')
+                writer = csv.DictWriter(csv_file, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+        except (OSError, csv.Error) as e:
+            print(f"Error: Could not open {STATS_FILE}: {e}")
+            sys.exit(1)
 
-                # Store compression statistics
-                all_stats.append(compress_stats)
+    # Every (input, length, trie type) test not recorded yet, in a fixed order
+    settings = {name: csv_text(value) for name, value in codec_settings(args, dictionary).items()}
+    settings.update(block_size=str(args.block_size or 0), auto_goal=csv_text(args.auto), memory_limit=csv_text(args.memory_limit),
+                    max_bits=str(max_bits))
+    def tests():
+        for input_info in test_files:
+            file_id, raw_text = (input_info, gutenberg.raw(input_info)) if input_info in file_ids else input_info
+            file_label = os.path.basename(file_id).split('.')[0] if args.file else file_id
 
-                # Step 2: Decompress the Data Using LZW
-                decompressor = LZWDecompressor(max_bits=max_bits, fixedLZW=fixed_lzw)
-                decompressed_bytes, decompress_stats = decompressor.decompress(compressed_data[:], generate_stats=True)  # Use a copy of compressed_data
-                decompress_stats['trie_type'] = trie_type
-                decompress_stats['text_length'] = length_label.split(' ')[0]
-                decompress_stats['file_id'] = os.path.basename(file_id).split('.')[0] if args.file else file_id
+            for length_label, length in length_tests.items():
+                # Use only a portion of the text based on the length label, converted to bytes
+                byte_sequence = raw_text[:length]
+                if isinstance(byte_sequence, str):
+                    byte_sequence = text_to_bytes(byte_sequence)
 
-                # Store decompression statistics
-                all_stats.append(decompress_stats)
+                # Run tests for Standard and for any other trie selected with --compact / --trie
+                for trie_type in trie_types:
+                    key = test_key(dict(settings, file_id=str(file_label), text_length=length_label.split(' ')[0], trie_type=trie_type))
+                    if key not in recorded:
+                        yield file_id, file_label, length_label.split(' ')[0], trie_type, byte_sequence
 
-                # Convert decompressed bytes back to text
-                decompressed_text = bytes_to_text(decompressed_bytes)
+    # The results come back in the order of the tests, whatever order the jobs finish in
+    cache_counters = dict.fromkeys(CACHE_FIELDS, 0)
+    try:
+        for compress_stats, decompress_stats, file_id, success, counters in run_ordered(run_test, tests(), args.jobs, args, dictionary):
+            # Store compression and decompression statistics
+            all_stats += [compress_stats, decompress_stats]
+            if writer is not None:
+                writer.writerows([compress_stats, decompress_stats])
+                csv_file.flush()
+            for name, value in counters.items():
+                cache_counters[name] += value
 
-                # Step 3: Verify if the decompressed text matches the original text
-                if test_text == decompressed_text:
-                    print(f"SUCCESS\t{trie_type:<10}{length_label.split(' ')[0]:<10}{file_id}")
-                else:
-                    print(f"ERROR\t{trie_type}\t{length_label.split(' ')[0]}\t{file_id}")
+            # Verify if the decompressed bytes match the original ones
+            if success:
+                print(f"SUCCESS\t{compress_stats['trie_type']:<10}{compress_stats['text_length']:<10}{file_id}")
+            else:
+                print(f"ERROR\t{compress_stats['trie_type']}\t{compress_stats['text_length']}\t{file_id}")
+    finally:
+        if csv_file is not None:
+            csv_file.close()
 
-    # Optionally, save statistics to a CSV file for further analysis
     if generate_stats:
-        output_file = "stats.csv"
-        with open(output_file, mode='w', newline='') as csv_file:
-            fieldnames = ['operation', 'ratio', 'dictionary_size', 'memory_usage', 'execution_time', 'bits_used', 'trie_type', 'text_length', 'file_id']
-            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for stat in all_stats:
-                writer.writerow(stat)
+        print(f"\nStatistics have been saved to {STATS_FILE}")
 
-        print(f"\nStatistics have been saved to {output_file}")
+    if args.cache or args.cache_dir:
+        print(f"\nCache: {cache_counters['cache_hits']} hits, {cache_counters['cache_misses']} misses, "
+              f"{cache_counters['cache_evictions']} evictions")
 
     # Optionally, generate graphs about results statistics
     if plot_graphs:
+        from plot import generate_graphs
         generate_graphs(all_stats, output_folder=".")
 
 if __name__ == "__main__":
@@ -36,6 +36,8 @@ def generate_graphs(all_stats, output_folder="."):
             group = group.sort_values(by='text_length_numeric')
             color = '#1f77b4' if trie_type == "Standard" else '#ff7f0e'
             linestyle = '-' if trie_type == "Standard" else '--'
+            if trie_type == "Flat":
+                color, linestyle = '#2ca02c', ':'
             plt.plot(group['text_length_numeric'], group['ratio'],
                      linestyle=linestyle, color=color,
                      linewidth=linewidth, alpha=0.5)
@@ -44,6 +46,8 @@ def generate_graphs(all_stats, output_folder="."):
                         s=100, zorder=zorder)
         plt.plot([], [], color='#1f77b4', linestyle='-', linewidth=linewidth, label='Standard Trie')
         plt.plot([], [], color='#ff7f0e', linestyle='--', linewidth=linewidth, label='Compact Trie')
+        if (compression_stats['trie_type'] == "Flat").any():
+            plt.plot([], [], color='#2ca02c', linestyle=':', linewidth=linewidth, label='Flat Trie')
         plt.xlabel('Text Length Category')
         plt.ylabel('Compression Ratio')
         plt.title('Compression Ratio Comparison')
@@ -62,6 +66,8 @@ def generate_graphs(all_stats, output_folder="."):
             group = group.sort_values(by='text_length_numeric')
             color = '#d62728' if trie_type == "Standard" else '#17becf'
             linestyle = '-' if trie_type == "Standard" else '--'
+            if trie_type == "Flat":
+                color, linestyle = '#9467bd', ':'
             plt.plot(group['text_length_numeric'], group['memory_usage'],
                      linestyle=linestyle, color=color,
                      linewidth=linewidth, alpha=0.5)
@@ -70,6 +76,8 @@ def generate_graphs(all_stats, output_folder="."):
                         s=100, zorder=zorder)
         plt.plot([], [], color='#d62728', linestyle='-', linewidth=linewidth, label='Standard Trie')
         plt.plot([], [], color='#17becf', linestyle='--', linewidth=linewidth, label='Compact Trie')
+        if (compression_stats['trie_type'] == "Flat").any():
+            plt.plot([], [], color='#9467bd', linestyle=':', linewidth=linewidth, label='Flat Trie')
         plt.xlabel('Text Length Category')
         plt.ylabel('Memory Usage (Bytes)')
         plt.title('Memory Usage Comparison')
@@ -88,6 +96,8 @@ def generate_graphs(all_stats, output_folder="."):
             group = group.sort_values(by='text_length_numeric')
             color = 'c' if trie_type == "Standard" else 'orange'
             linestyle = '-' if trie_type == "Standard" else '--'
+            if trie_type == "Flat":
+                color, linestyle = 'm', ':'
             plt.plot(group['text_length_numeric'], group['execution_time'],
                      linestyle=linestyle, color=color,
                      linewidth=linewidth, alpha=0.5)
@@ -96,6 +106,8 @@ def generate_graphs(all_stats, output_folder="."):
                         s=100, zorder=zorder)
         plt.plot([], [], color='c', linestyle='-', linewidth=linewidth, label='Standard Trie')
         plt.plot([], [], color='orange', linestyle='--', linewidth=linewidth, label='Compact Trie')
+        if (compression_stats['trie_type'] == "Flat").any():
+            plt.plot([], [], color='m', linestyle=':', linewidth=linewidth, label='Flat Trie')
         plt.xlabel('Text Length Category')
         plt.ylabel('Execution Time (Seconds)')
         plt.title('Compression Time')
@@ -114,6 +126,8 @@ def generate_graphs(all_stats, output_folder="."):
             group = group.sort_values(by='text_length_numeric')
             color = 'y' if trie_type == "Standard" else 'k'
             linestyle = '-' if trie_type == "Standard" else '--'
+            if trie_type == "Flat":
+                color, linestyle = 'b', ':'
             plt.plot(group['text_length_numeric'], group['execution_time'],
                      linestyle=linestyle, color=color,
                      linewidth=linewidth, alpha=0.5)
@@ -122,6 +136,8 @@ def generate_graphs(all_stats, output_folder="."):
                         s=100, zorder=zorder)
         plt.plot([], [], color='y', linestyle='-', linewidth=linewidth, label='Standard Trie')
         plt.plot([], [], color='k', linestyle='--', linewidth=linewidth, label='Compact Trie')
+        if (decompression_stats['trie_type'] == "Flat").any():
+            plt.plot([], [], color='b', linestyle=':', linewidth=linewidth, label='Flat Trie')
         plt.xlabel('Text Length Category')
         plt.ylabel('Execution Time (Seconds)')
         plt.title('Decompression Time')
@@ -140,6 +156,8 @@ def generate_graphs(all_stats, output_folder="."):
             group = group.sort_values(by='text_length_numeric')
             color = 'orange' if trie_type == "Standard" else 'g'
             linestyle = '-' if trie_type == "Standard" else '--'
+            if trie_type == "Flat":
+                color, linestyle = 'r', ':'
             plt.plot(group['text_length_numeric'], group['dictionary_size'],
                      linestyle=linestyle, color=color,
                      linewidth=linewidth, alpha=0.5)
@@ -148,6 +166,8 @@ def generate_graphs(all_stats, output_folder="."):
                         s=100, zorder=zorder)
         plt.plot([], [], color='orange', linestyle='-', linewidth=linewidth, label='Standard Trie')
         plt.plot([], [], color='g', linestyle='--', linewidth=linewidth, label='Compact Trie')
+        if (compression_stats['trie_type'] == "Flat").any():
+            plt.plot([], [], color='r', linestyle=':', linewidth=linewidth, label='Flat Trie')
         plt.xlabel('Text Length Category')
         plt.ylabel('Dictionary Size')
         plt.title('Dictionary Size Growth')
@@ -0,0 +1,223 @@
+# range_coder.py
+
+# Adaptive entropy coding of LZW codes, a drop-in replacement for BitWriter
+# and BitReader (see bit_io.py): write(code, width) / read(width) take the same
+# arguments, so the compressor and decompressor do not change. Instead of
+# width bits, every code costs about -log2 of its probability under an
+# adaptive order-0 model of the codes seen so far, so the frequent codes
+# (single bytes, short common phrases) take fewer bits than the rare ones.
+#
+# The model counts every code in a Fenwick tree, which gives the cumulative
+# count of a code (and the code of a cumulative count) in O(log n) steps. A
+# code that has not been seen yet (or not recently) is sent as an escape
+# symbol followed by the code itself in width bits, which is what it would
+# have cost without this stage. A final EOF symbol marks the end. Counts are
+# halved whenever their total reaches MAX_TOTAL, which keeps the model
+# following the data and the arithmetic within 32 bits.
+#
+# The range coder itself is the carry-propagating 32-bit coder used by LZMA:
+# low is kept to 33 bits, and a byte that a later carry may still change is
+# held back (with the run of 0xFF bytes after it) until it is known.
+
+MAX_ENTROPY_BITS = 16  # Codes wider than this would make every rescale too slow
+TOP = 1 << 24
+MASK = (1 << 32) - 1
+MAX_TOTAL = 1 << 16
+# Bytes a reader shifts in for one code: up to 3 for the symbol (the total is
+# at most about MAX_TOTAL), 2 more for the width bits of an escaped code
+MAX_CODE_BYTES = 5
+START_BYTES = 5  # The dummy byte and the first 4 bytes of low, read up front
+INCREMENT = 1  # Slow adaptation keeps the long tail of codes in the model, which pays on text
+EOF_COUNT = 1
+FIRST_ESCAPE_COUNT = INCREMENT
+
+class _CodeModel:
+    # Adaptive counts of the codes below table_size. Cumulative counts start
+    # with EOF, then the escape symbol, then the codes in order.
+    def __init__(self, table_size):
+        if table_size > 1 << MAX_ENTROPY_BITS:
+            raise ValueError(f"Entropy coding supports codes of up to {MAX_ENTROPY_BITS} bits.")
+        self.size = table_size
+        self.counts = [0] * table_size
+        self.tree = [0] * (table_size + 1)  # Fenwick tree of counts, 1-based
+        self.escape = FIRST_ESCAPE_COUNT
+        self.total = EOF_COUNT + self.escape
+        self.top_bit = 1 << (table_size.bit_length() - 1)  # Highest power of two in the tree
+
+    def cumulative(self, code):
+        # Sum of the counts of the codes below code
+        tree = self.tree
+        total = 0
+        while code:
+            total += tree[code]
+            code &= code - 1
+        return total
+
+    def find(self, target):
+        # The code whose cumulative range holds target (a count below the sum of
+        # all code counts), and the cumulative count it starts at
+        tree = self.tree
+        size = self.size
+        position = 0
+        step = self.top_bit
+        while step:
+            following = position + step
+            if following <= size and tree[following] <= target:
+                position = following
+                target -= tree[following]
+            step >>= 1
+        return position, target
+
+    def add(self, code):
+        self.counts[code] += INCREMENT
+        tree = self.tree
+        size = self.size
+        index = code + 1
+        while index <= size:
+            tree[index] += INCREMENT
+            index += index & -index
+        self.total += INCREMENT
+        if self.total > MAX_TOTAL:
+            self._rescale()
+
+    def _rescale(self):
+        # Halve every count, dropping the codes that fall to zero back to escapes,
+        # and rebuild the tree
+        counts = [count >> 1 for count in self.counts]
+        self.counts = counts
+        tree = [0] + counts
+        size = self.size
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self.tree = tree
+        self.escape = max(self.escape >> 1, 1)
+        self.total = EOF_COUNT + self.escape + sum(counts)
+
+class RangeCodeWriter:
+    def __init__(self, max_bits, buffer=None):
+        self.buffer = bytearray() if buffer is None else buffer
+        self.model = _CodeModel(1 << max_bits)
+        self.low = 0
+        self.range = MASK
+        self.cache = 0  # The byte a carry may still change, output once it cannot
+        self.pending = 1  # cache and the 0xFF bytes after it not output yet (the first is a dummy 0)
+        self.bytes_written = 0
+
+    def _encode(self, start, size, total):
+        step = self.range // total
+        self.low += start * step
+        self.range = step * size
+        while self.range < TOP:
+            self.range <<= 8
+            self._shift_low()
+
+    def _shift_low(self):
+        low = self.low
+        if low < 0xFF000000 or low > MASK:
+            carry = low >> 32
+            byte = self.cache
+            for _ in range(self.pending):
+                self.buffer.append((byte + carry) & 0xFF)
+                byte = 0xFF
+            self.bytes_written += self.pending
+            self.pending = 0
+            self.cache = (low >> 24) & 0xFF
+        self.pending += 1
+        self.low = (low << 8) & MASK
+
+    def write(self, code, width):
+        model = self.model
+        count = model.counts[code]
+        if count:
+            self._encode(EOF_COUNT + model.escape + model.cumulative(code), count, model.total)
+        else:
+            # Not in the model: escape, then the code itself in width bits
+            self._encode(EOF_COUNT, model.escape, model.total)
+            step = self.range >> width
+            self.low += code * step
+            self.range = step
+            while self.range < TOP:
+                self.range <<= 8
+                self._shift_low()
+            model.escape += INCREMENT
+            model.total += INCREMENT
+        model.add(code)
+
+    def flush(self):
+        # End with EOF and push out every byte of low
+        self._encode(0, EOF_COUNT, self.model.total)
+        for _ in range(5):
+            self._shift_low()
+        return self.buffer
+
+    def drain(self):
+        # Hand over the bytes written so far; no later carry can change them
+        data = bytes(self.buffer)
+        del self.buffer[:]
+        return data
+
+    def get_bit_length(self):
+        return (self.bytes_written + self.pending) * 8
+
+class RangeCodeReader:
+    # With final=False more data may still follow end, as in a stream: read()
+    # then stops (returns None) while fewer than MAX_CODE_BYTES bytes are left,
+    # and can go on once end has been moved on. Set final once end is the end
+    # of the code stream to decode the rest. data may lose the bytes before
+    # position in between, if position is moved back with them.
+    def __init__(self, max_bits, data, start=0, end=None, final=True):
+        self.data = data
+        self.end = len(data) if end is None else end
+        self.final = final
+        self.model = _CodeModel(1 << max_bits)
+        self.range = MASK
+        # The first byte is the encoder's dummy cache byte
+        self.code = int.from_bytes(bytes(data[start + 1:min(start + 5, self.end)]).ljust(4, b'\0'), 'big')
+        self.position = start + 5
+        self.finished = False
+
+    def _next_byte(self):
+        position = self.position
+        self.position += 1
+        # Past the end the stream is padded with zeros, like the encoder's final flush
+        return self.data[position] if position < self.end else 0
+
+    def _consume(self, start, size, step):
+        self.code -= start * step
+        self.range = step * size
+        while self.range < TOP:
+            self.code = ((self.code << 8) | self._next_byte()) & MASK
+            self.range <<= 8
+
+    def read(self, width):
+        # The next code, or None after the EOF symbol
+        if self.finished or (not self.final and self.end - self.position < MAX_CODE_BYTES):
+            return None
+        model = self.model
+        step = self.range // model.total
+        target = self.code // step
+        if target >= model.total:
+            raise ValueError("Entropy-coded LZW data is corrupted.")
+        if target < EOF_COUNT:
+            self.finished = True
+            if self.position > self.end:
+                raise ValueError("Entropy-coded LZW data is truncated.")
+            return None
+
+        if target < EOF_COUNT + model.escape:
+            self._consume(EOF_COUNT, model.escape, step)
+            step = self.range >> width
+            code = self.code // step
+            self._consume(code, 1, step)
+            model.escape += INCREMENT
+            model.total += INCREMENT
+        else:
+            code, offset = model.find(target - EOF_COUNT - model.escape)
+            count = model.counts[code]
+            self._consume(target - offset, count, step)
+        if code >= model.size:
+            raise ValueError("Entropy-coded LZW data is corrupted.")
+        model.add(code)
+        return code
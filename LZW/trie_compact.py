@@ -1,135 +1,216 @@
 # trie_compact.py
 
-import sys
+from lzw_memory import deep_sizeof
 
 class CompactTrieNode:
-    def __init__(self):
-        self.children = {}
+    __slots__ = ('children', 'edge', 'index')  # See StandardTrieNode
+
+    def __init__(self, edge=b''):
+        self.children = {}  # First byte of the child's edge label -> child node
+        self.edge = edge  # Label of the edge leading to this node
         self.index = None
 
+# Sibling edges never start with the same byte (they would share a prefix and be
+# merged), so each step looks up one child by its first byte and compares the
+# rest of the label with a single slice comparison, instead of scanning every
+# child key.
 class CompactTrie:
     def __init__(self):
         self.root = CompactTrieNode()
-        self.memory_usage = sys.getsizeof(self.root)
         self.dictionary_size = 0  # Track the number of unique substrings added
+        # See StandardTrie: the snapshot reset() returns to and the nodes added since
+        self.base = None
+        self.added = None
+        self.added_limit = 0
 
     def insert(self, sequence, index):
         current_node = self.root
-        while sequence:
-            found_prefix = False
-            for child_key in list(current_node.children.keys()):
-                prefix_length = self._common_prefix_length(sequence, child_key)
-
-                if prefix_length > 0:
-                    found_prefix = True
-
-                    # Full match of the current prefix with the child key
-                    if prefix_length == len(child_key):
-                        current_node = current_node.children[child_key]
-                        sequence = sequence[prefix_length:]
-                    else:
-                        # Partial match, splitting the node
-                        existing_child = current_node.children.pop(child_key)
-
-                        # Create a new split node for the common prefix
-                        split_node = CompactTrieNode()
-                        self.memory_usage += sys.getsizeof(split_node)
-
-                        split_node.children[child_key[prefix_length:]] = existing_child
-                        self.memory_usage += sys.getsizeof(existing_child)
-
-                        # Add the split node under the common prefix
-                        current_node.children[child_key[:prefix_length]] = split_node
-                        self.memory_usage += sys.getsizeof(child_key[:prefix_length])
-
-                        # Add the remaining part of the new sequence as a new node
-                        if len(sequence) > prefix_length:
-                            new_node = CompactTrieNode()
-                            self.memory_usage += sys.getsizeof(new_node)
-                            split_node.children[sequence[prefix_length:]] = new_node
-                            new_node.index = index
-                            self.dictionary_size += 1  # Count this as a new dictionary entry
-                        else:
-                            split_node.index = index
-
-                        # Count the split node as a new entry only if it was newly added
-                        self.dictionary_size += 1
-                        return
-                    break
-
-            # If no common prefix is found, add the sequence as a new branch
-            if not found_prefix:
-                new_node = CompactTrieNode()
-                self.memory_usage += sys.getsizeof(new_node)
-                current_node.children[sequence] = new_node
+        position = 0
+        while position < len(sequence):
+            child = current_node.children.get(sequence[position])
+
+            # If no edge starts with the next byte, add the rest of the sequence as a new branch
+            if child is None:
+                new_node = CompactTrieNode(bytes(sequence[position:]))
+                current_node.children[sequence[position]] = new_node
                 new_node.index = index
                 self.dictionary_size += 1  # Count this as a new dictionary entry
+                if self.added is not None:
+                    self._record(current_node, sequence[position])
                 return
 
-    def search(self, sequence):
+            edge = child.edge
+            if sequence[position:position + len(edge)] == edge:
+                # Full match of the edge label, move down to the child
+                current_node = child
+                position += len(edge)
+                continue
+
+            # Partial match, split the edge where the sequence leaves it. That changes
+            # an existing node, which reset() cannot undo by removing additions.
+            self.added = None
+            prefix_length = self._common_prefix_length(sequence[position:position + len(edge)], edge)
+            split_node = CompactTrieNode(edge[:prefix_length])
+            current_node.children[edge[0]] = split_node
+            child.edge = edge[prefix_length:]
+            split_node.children[child.edge[0]] = child
+
+            # Add the remaining part of the new sequence as a new node
+            position += prefix_length
+            if position < len(sequence):
+                new_node = CompactTrieNode(bytes(sequence[position:]))
+                split_node.children[sequence[position]] = new_node
+                new_node.index = index
+            else:
+                split_node.index = index
+            self.dictionary_size += 1
+            return
+
+        # The sequence ends on an existing node (e.g. one created by a split)
+        if current_node.index is None:
+            self.dictionary_size += 1
+            current_node.index = index
+
+    def _find(self, sequence):
+        # The node the whole sequence leads to, or None if it ends inside an edge or is missing
         current_node = self.root
-        while sequence:
-            found_prefix = False
-            for child_key in current_node.children.keys():
-                prefix_length = self._common_prefix_length(sequence, child_key)
-
-                # Check if we have a full match with the child key
-                if prefix_length == len(child_key):
-                    # Move to the next level of the trie
-                    current_node = current_node.children[child_key]
-                    sequence = sequence[prefix_length:]
-                    found_prefix = True
-                    break
-
-                # If we find an exact match of the sequence with the child_key
-                elif prefix_length == len(sequence) and prefix_length == len(child_key):
-                    return current_node.children[child_key].index
-
-            if not found_prefix:
+        position = 0
+        while position < len(sequence):
+            child = current_node.children.get(sequence[position])
+            if child is None:
+                return None
+            edge = child.edge
+            if sequence[position:position + len(edge)] != edge:
                 return None
+            current_node = child
+            position += len(edge)
+        return current_node
 
-        return current_node.index
+    def search(self, sequence):
+        node = self._find(sequence)
+        return None if node is None else node.index
+
+    # Cursor API: a cursor is a (node, child, matched) tuple, i.e. the position
+    # reached after following child.edge[:matched] from node. matched == 0 means
+    # the cursor sits exactly on node.
+    def root_cursor(self):
+        return (self.root, None, 0)
+
+    def step(self, cursor, byte):
+        node, child, matched = cursor
+        if matched == 0:
+            child = node.children.get(byte)
+            if child is None:
+                return None
+        elif child.edge[matched] != byte:
+            return None
+
+        matched += 1
+        if matched == len(child.edge):
+            # Consumed the whole edge label, so we land on the child node
+            return (child, None, 0)
+        return (node, child, matched)
+
+    def cursor_index(self, cursor):
+        node, child, matched = cursor
+        # Positions in the middle of an edge are never the end of a stored sequence
+        return node.index if matched == 0 else None
+
+    def insert_at(self, cursor, byte, index):
+        node, child, matched = cursor
+        if matched:
+            # The cursor is in the middle of an edge, split it there first (see insert())
+            self.added = None
+            split_node = CompactTrieNode(child.edge[:matched])
+            node.children[child.edge[0]] = split_node
+            child.edge = child.edge[matched:]
+            split_node.children[child.edge[0]] = child
+            node = split_node
+
+        new_node = CompactTrieNode(bytes([byte]))
+        new_node.index = index
+        node.children[byte] = new_node
+        self.dictionary_size += 1
+        if self.added is not None:
+            self._record(node, byte)
+        return (new_node, None, 0)
+
+    def _record(self, node, first_byte):
+        self.added.append((node, first_byte))
+        if len(self.added) > self.added_limit:
+            self.added = None
 
     def remove(self, sequence):
-        # Helper function to recursively remove nodes and update the trie structure
-        def _remove(node, sequence, depth):
-            if depth == len(sequence):
-                # Reached the end of the sequence
-                if node.index is not None:
-                    node.index = None  # Remove the index
-                    # If this node has no children, indicate it can be deleted
-                    return len(node.children) == 0
-                return False
-
-            # Get the current prefix length and child node
-            for child_key in list(node.children.keys()):
-                prefix_length = self._common_prefix_length(sequence[depth:], child_key)
-
-                if prefix_length > 0:
-                    # Traverse deeper if the current child_key matches the prefix
-                    child_node = node.children[child_key]
-
-                    # If the entire child_key matches the current part of the sequence
-                    if prefix_length == len(child_key):
-                        should_delete_child = _remove(child_node, sequence, depth + prefix_length)
-
-                        # If the child node should be deleted, remove it from the children dictionary
-                        if should_delete_child:
-                            del node.children[child_key]
-                            self.memory_usage -= sys.getsizeof(child_node)
-
-                            # If the current node is now empty and does not have an index, delete it
-                            return len(node.children) == 0 and node.index is None
-
-                    # Handle cases where a partial prefix matches
-                    elif prefix_length > 0 and prefix_length < len(child_key):
-                        # The node is partially matched, which means removal ends here as the exact sequence isn't fully matched
-                        return False
-
-            return False
-
-        # Start removal from the root node
-        _remove(self.root, sequence, 0)
+        # As in StandardTrie, reset() expects the sequences of a restored snapshot to stay
+        # Walk down remembering the path, then prune nodes left without index or children
+        path = []
+        current_node = self.root
+        position = 0
+        while position < len(sequence):
+            child = current_node.children.get(sequence[position])
+            if child is None or sequence[position:position + len(child.edge)] != child.edge:
+                return  # Sequence does not exist in the trie
+            path.append(current_node)
+            current_node = child
+            position += len(child.edge)
+
+        if current_node.index is None:
+            return
+        current_node.index = None
+        self.dictionary_size -= 1
+
+        while path and not current_node.children and current_node.index is None:
+            parent = path.pop()
+            del parent.children[current_node.edge[0]]
+            current_node = parent
+
+    def reset(self):
+        # Back to the snapshot last given to restore(), see StandardTrie.reset()
+        if self.base is not None:
+            if self.added is None:
+                self.restore(self.base)
+                return
+            for node, first_byte in self.added:
+                node.children.pop(first_byte, None)
+            self.added.clear()
+            self.dictionary_size = self.base.dictionary_size
+            return
+
+        # Otherwise drop every sequence longer than one byte, keeping the single-byte
+        # edges below the root (and their nodes) so they do not have to be rebuilt
+        for first_byte, child in list(self.root.children.items()):
+            if len(child.edge) == 1:
+                child.children.clear()
+            else:
+                del self.root.children[first_byte]
+        single_byte_nodes = self.root.children.values()
+        self.dictionary_size = sum(1 for node in single_byte_nodes if node.index is not None)
+        if self.root.index is not None:
+            self.dictionary_size += 1
+
+    def snapshot(self):
+        # A copy of the trie in its current state, for restore()
+        snapshot = CompactTrie()
+        snapshot.restore(self)
+        snapshot.base = snapshot.added = None
+        return snapshot
+
+    def restore(self, snapshot):
+        # Make this trie a copy of snapshot (another CompactTrie), see StandardTrie.restore()
+        node_count = 0
+        stack = [(snapshot.root, self.root)]
+        while stack:
+            source, target = stack.pop()
+            target.index = source.index
+            children = target.children = {}
+            for first_byte, child in source.children.items():
+                copy = children[first_byte] = CompactTrieNode(child.edge)
+                stack.append((child, copy))
+            node_count += 1
+        self.dictionary_size = snapshot.dictionary_size
+        self.base = snapshot
+        self.added = []
+        self.added_limit = node_count
 
     def _common_prefix_length(self, word1, word2):
         # Helper method to calculate common prefix length
@@ -143,15 +224,20 @@ class CompactTrie:
         return self.dictionary_size
 
     def get_memory_usage(self):
-        return self.memory_usage
+        # Deep size of every node with its children dict, edge label and index
+        return deep_sizeof(self.root)
+
+    @property
+    def memory_usage(self):
+        return self.get_memory_usage()
 
     def visualize_trie(self):
         # Helper function to visualize the trie structure recursively
         def _visualize(node, prefix, level):
-            for child_key, child in node.children.items():
-                child_prefix = prefix + child_key.decode()  # Convert bytes to a string for visualization
+            for child in node.children.values():
+                child_prefix = prefix + child.edge.decode()  # Convert bytes to a string for visualization
                 if level > 0:
-                    print("  " * (level - 1) + f"{child_key.decode()} (Index: {child.index})")
+                    print("  " * (level - 1) + f"{child.edge.decode()} (Index: {child.index})")
                 _visualize(child, child_prefix, level + 1)
 
         print("Compact Trie Structure:")
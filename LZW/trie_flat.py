@@ -0,0 +1,357 @@
+# trie_flat.py
+
+from array import array
+from lzw_memory import deep_sizeof
+
+# Nodes are plain integers (0 is the root) and all of the structure lives in
+# preallocated integer arrays instead of one Python object and dict per node.
+# The root and the nodes directly below it (the single bytes in LZW) are the
+# busiest, so their children sit in a dense 256-wide table; deeper nodes find
+# their children in an open-addressing hash table keyed on (node, byte).
+DENSE_NODES = 257
+EMPTY = -1
+
+class FlatTrie:
+    def __init__(self, max_bits=12):
+        self.indices = array('i', [EMPTY])  # Index stored at each node, EMPTY if none
+        self.child_counts = array('i', [0])
+        self.node_count = 1  # Node ids in use; the arrays may be longer after a reset
+        self.free_nodes = []  # Ids of removed nodes, reused by later inserts
+
+        self.dense = array('i', bytes(4 * DENSE_NODES * 256))  # 0 means no child (the root is never a child)
+
+        # Sized so that a full LZW table keeps the hash table at most half full
+        slot_count = 1 << (2 ** (max_bits + 1) - 1).bit_length()
+        self.slot_keys = array('q', [EMPTY]) * slot_count
+        self.slot_nodes = array('i', bytes(4 * slot_count))
+        self.slot_mask = slot_count - 1
+        self.used_slots = 0
+
+        self.dictionary_size = 0
+        self.base = None  # The snapshot reset() returns to, set by restore()
+        # Once reset() or restore() has set the state reset() returns to: the
+        # dense cells (below the root row) and hash slots written since, so
+        # reset() only has to put those back. None when not kept, or once undoing
+        # them would cost more than clearing the tables.
+        self.dense_written = None
+        self.slots_written = None
+        self.journal_room = 0  # Additions left before the journal is dropped
+
+    def _find_slot(self, key):
+        # Linear probing; returns the slot holding key or the empty slot where it belongs
+        slot_keys = self.slot_keys
+        mask = self.slot_mask
+        slot = ((key * 2654435761) >> 16) & mask
+        while True:
+            slot_key = slot_keys[slot]
+            if slot_key == key or slot_key == EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _child(self, node, byte):
+        if node < DENSE_NODES:
+            return self.dense[(node << 8) | byte] or None
+        key = (node << 8) | byte
+        slot = self._find_slot(key)
+        return self.slot_nodes[slot] if self.slot_keys[slot] == key else None
+
+    def _add_child(self, node, byte):
+        if self.free_nodes:
+            child = self.free_nodes.pop()
+        else:
+            child = self.node_count
+            self.node_count += 1
+            if child == len(self.indices):
+                self.indices.append(EMPTY)
+                self.child_counts.append(0)
+            else:
+                # Reuse the storage left behind by reset()
+                self.indices[child] = EMPTY
+                self.child_counts[child] = 0
+
+        journal = self.dense_written is not None
+        if journal:
+            self.journal_room -= 1
+            if self.journal_room < 0:
+                self.dense_written = self.slots_written = None
+                journal = False
+        if node < DENSE_NODES:
+            self.dense[(node << 8) | byte] = child
+            if node and journal:
+                self.dense_written.append((node << 8) | byte)
+        else:
+            if (self.used_slots + 1) * 2 > len(self.slot_keys):
+                self._grow()
+            key = (node << 8) | byte
+            slot = self._find_slot(key)
+            self.slot_keys[slot] = key
+            self.slot_nodes[slot] = child
+            self.used_slots += 1
+            if journal:
+                self.slots_written.append(slot)
+
+        self.child_counts[node] += 1
+        return child
+
+    def _remove_child(self, node, byte):
+        child = self._child(node, byte)
+        self.child_counts[node] -= 1
+        self.indices[child] = EMPTY
+        self.free_nodes.append(child)
+
+        if node < DENSE_NODES:
+            self.dense[(node << 8) | byte] = 0
+            if node and self.dense_written is not None:
+                self.dense_written.append((node << 8) | byte)
+            return
+
+        # Backward-shift deletion keeps every probe sequence unbroken without tombstones
+        slot_keys = self.slot_keys
+        slot_nodes = self.slot_nodes
+        mask = self.slot_mask
+        hole = self._find_slot((node << 8) | byte)
+        slot = hole
+        while True:
+            slot = (slot + 1) & mask
+            key = slot_keys[slot]
+            if key == EMPTY:
+                break
+            home = ((key * 2654435761) >> 16) & mask
+            # Move the entry back into the hole if the hole lies on its probe path
+            if (slot - home) & mask >= (slot - hole) & mask:
+                slot_keys[hole] = key
+                slot_nodes[hole] = slot_nodes[slot]
+                if self.slots_written is not None:
+                    self.slots_written.append(hole)
+                hole = slot
+        slot_keys[hole] = EMPTY
+        if self.slots_written is not None:
+            self.slots_written.append(hole)
+        self.used_slots -= 1
+
+    def _grow(self):
+        # Every entry moves, so the journal no longer says what to undo
+        self.dense_written = self.slots_written = None
+        old_keys = self.slot_keys
+        old_nodes = self.slot_nodes
+        slot_count = len(old_keys) * 2
+        self.slot_keys = array('q', [EMPTY]) * slot_count
+        self.slot_nodes = array('i', bytes(4 * slot_count))
+        self.slot_mask = slot_count - 1
+        for slot, key in enumerate(old_keys):
+            if key != EMPTY:
+                new_slot = self._find_slot(key)
+                self.slot_keys[new_slot] = key
+                self.slot_nodes[new_slot] = old_nodes[slot]
+
+    def insert(self, sequence, index):
+        node = 0
+        for byte in sequence:
+            child = self._child(node, byte)
+            node = self._add_child(node, byte) if child is None else child
+
+        if self.indices[node] == EMPTY:
+            # Only increase dictionary size if this is a new entry
+            self.dictionary_size += 1
+            self.indices[node] = index
+
+    def search(self, sequence):
+        node = 0
+        for byte in sequence:
+            node = self._child(node, byte)
+            if node is None:
+                return None
+        index = self.indices[node]
+        return None if index == EMPTY else index
+
+    def remove(self, sequence):
+        # Walk down remembering the path, then prune nodes left without index or children
+        path = []
+        node = 0
+        for byte in sequence:
+            child = self._child(node, byte)
+            if child is None:
+                return  # Sequence does not exist in the trie
+            path.append((node, byte))
+            node = child
+
+        if self.indices[node] == EMPTY:
+            return
+        self.indices[node] = EMPTY
+        self.dictionary_size -= 1
+
+        while path and self.child_counts[node] == 0 and self.indices[node] == EMPTY:
+            parent, byte = path.pop()
+            self._remove_child(parent, byte)
+            node = parent
+
+    def reset(self):
+        # Back to the snapshot last given to restore(), or else to the single
+        # bytes. After the first time, this only puts back the cells written
+        # since (and copies the root row and the node columns of the state it
+        # returns to), so the cost follows the number of sequences added rather
+        # than the size of the tables.
+        if self.dense_written is not None:
+            self._undo()
+            return
+        if self.base is not None:
+            self.restore(self.base)
+            return
+
+        # Otherwise drop every sequence longer than one byte. The single-byte nodes
+        # keep their ids and the root keeps its row of the dense table; every other
+        # node is freed. The arrays keep their size and are overwritten as the trie
+        # grows again.
+        single_byte_nodes = [child for child in self.dense[:256] if child]
+        dense_rows = min(self.node_count, DENSE_NODES)
+        if dense_rows > 1:
+            # Zeroed through a byte view: building a zero array to copy from costs more
+            row_bytes = 256 * self.dense.itemsize
+            memoryview(self.dense).cast('B')[row_bytes:dense_rows * row_bytes] = bytes((dense_rows - 1) * row_bytes)
+        if self.used_slots:
+            self.slot_keys[:] = array('q', [EMPTY]) * len(self.slot_keys)
+            self.used_slots = 0
+
+        # In LZW the single bytes are the first nodes, so nothing is left to free
+        self.node_count = max(single_byte_nodes, default=0) + 1
+        kept = set(single_byte_nodes)
+        self.free_nodes[:] = [node for node in range(1, self.node_count) if node not in kept]
+        for node in self.free_nodes:
+            self.indices[node] = EMPTY
+        memoryview(self.child_counts).cast('B')[:self.node_count * self.child_counts.itemsize] = \
+            bytes(self.node_count * self.child_counts.itemsize)
+        self.child_counts[0] = len(single_byte_nodes)
+
+        self.dictionary_size = sum(1 for node in single_byte_nodes if self.indices[node] != EMPTY)
+        self._keep()
+
+    def _keep(self):
+        # Make the current state the one reset() returns to, and start the journal
+        self.kept_root = self.dense[:256]
+        self.kept_indices = self.indices[:self.node_count]
+        self.kept_child_counts = self.child_counts[:self.node_count]
+        self.kept_free_nodes = self.free_nodes[:]
+        self.kept_counts = (self.node_count, self.used_slots, self.dictionary_size)
+        self.dense_written = []
+        self.slots_written = []
+        self.journal_room = self._journal_size()
+
+    def _journal_size(self):
+        # Past this many additions, copying or clearing the whole tables is
+        # faster (removals only follow additions, as evictions)
+        return len(self.slot_keys) >> 4
+
+    def _undo(self):
+        # Put back the cells written since _keep(): from the snapshot, or empty
+        dense = self.dense
+        slot_keys = self.slot_keys
+        if self.base is None:
+            for position in self.dense_written:
+                dense[position] = 0
+            for slot in self.slots_written:
+                slot_keys[slot] = EMPTY
+        else:
+            base_dense = self.base.dense
+            base_keys = self.base.slot_keys
+            base_nodes = self.base.slot_nodes
+            slot_nodes = self.slot_nodes
+            for position in self.dense_written:
+                dense[position] = base_dense[position]
+            for slot in self.slots_written:
+                slot_keys[slot] = base_keys[slot]
+                slot_nodes[slot] = base_nodes[slot]
+        self.dense_written.clear()
+        self.slots_written.clear()
+        self.journal_room = self._journal_size()
+
+        # The root row and the columns of the kept nodes are small enough to copy whole
+        dense[:256] = self.kept_root
+        self.indices[:len(self.kept_indices)] = self.kept_indices
+        self.child_counts[:len(self.kept_child_counts)] = self.kept_child_counts
+        self.free_nodes[:] = self.kept_free_nodes
+        self.node_count, self.used_slots, self.dictionary_size = self.kept_counts
+
+    def snapshot(self):
+        # A copy of the trie in its current state, for restore()
+        snapshot = FlatTrie.__new__(FlatTrie)
+        snapshot.__dict__.update(self.__dict__)
+        for name in ('indices', 'child_counts', 'free_nodes', 'dense', 'slot_keys', 'slot_nodes'):
+            setattr(snapshot, name, getattr(self, name)[:])
+        snapshot.base = snapshot.dense_written = snapshot.slots_written = None
+        return snapshot
+
+    def restore(self, snapshot):
+        # Make this trie a copy of snapshot (another FlatTrie), and the state
+        # reset() returns to. Every array is copied into the existing one as a
+        # block of memory, which allocates nothing once the sizes match; later
+        # resets only undo what was written since.
+        self.indices[:] = snapshot.indices
+        self.child_counts[:] = snapshot.child_counts
+        self.node_count = snapshot.node_count
+        self.free_nodes[:] = snapshot.free_nodes
+        self.dense[:] = snapshot.dense
+        self.slot_keys[:] = snapshot.slot_keys
+        self.slot_nodes[:] = snapshot.slot_nodes
+        self.slot_mask = snapshot.slot_mask
+        self.used_slots = snapshot.used_slots
+        self.dictionary_size = snapshot.dictionary_size
+        self.base = snapshot
+        self._keep()
+
+    # Cursor API (see StandardTrie): here a cursor is simply a node id
+    def root_cursor(self):
+        return 0
+
+    def step(self, cursor, byte):
+        if cursor < DENSE_NODES:
+            return self.dense[(cursor << 8) | byte] or None
+        key = (cursor << 8) | byte
+        slot_keys = self.slot_keys
+        mask = self.slot_mask
+        slot = ((key * 2654435761) >> 16) & mask
+        while True:
+            slot_key = slot_keys[slot]
+            if slot_key == key:
+                return self.slot_nodes[slot]
+            if slot_key == EMPTY:
+                return None
+            slot = (slot + 1) & mask
+
+    def cursor_index(self, cursor):
+        index = self.indices[cursor]
+        return None if index == EMPTY else index
+
+    def insert_at(self, cursor, byte, index):
+        child = self._add_child(cursor, byte)
+        self.indices[child] = index
+        self.dictionary_size += 1
+        return child
+
+    def get_dictionary_size(self):
+        return self.dictionary_size
+
+    def get_memory_usage(self):
+        return deep_sizeof(self.indices, self.child_counts, self.free_nodes, self.dense, self.slot_keys, self.slot_nodes)
+
+    @property
+    def memory_usage(self):
+        return self.get_memory_usage()
+
+    def visualize_trie(self):
+        # Collect the children of every node from both tables, then print recursively
+        children = {}
+        for position, child in enumerate(self.dense):
+            if child:
+                children.setdefault(position >> 8, []).append((position & 0xFF, child))
+        for slot, key in enumerate(self.slot_keys):
+            if key != EMPTY:
+                children.setdefault(key >> 8, []).append((key & 0xFF, self.slot_nodes[slot]))
+
+        def _visualize(node, current_string, level):
+            if self.indices[node] != EMPTY:
+                print("  " * level + f"'{current_string}' (Index: {self.indices[node]})")
+            for byte, child in sorted(children.get(node, [])):
+                _visualize(child, current_string + chr(byte), level + 1)
+
+        print("Flat Trie Structure:")
+        _visualize(0, "", 0)
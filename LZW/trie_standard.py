@@ -1,8 +1,12 @@
 # trie_standard.py
 
-import sys
+from lzw_memory import deep_sizeof
 
 class StandardTrieNode:
+    # Fixed attributes instead of a per-node __dict__: smaller nodes, and sizes
+    # that sys.getsizeof reports exactly
+    __slots__ = ('children', 'index')
+
     def __init__(self):
         self.children = {}
         self.index = None  # Index of the sequence if it's the end of a sequence
@@ -10,8 +14,12 @@ class StandardTrieNode:
 class StandardTrie:
     def __init__(self):
         self.root = StandardTrieNode()
-        self.memory_usage = sys.getsizeof(self.root)
         self.dictionary_size = 0
+        # After a restore(): the snapshot reset() returns to, and the nodes added
+        # since as (parent, byte) pairs, so reset() only has to undo those
+        self.base = None
+        self.added = None
+        self.added_limit = 0
 
     def insert(self, sequence, index):
         current_node = self.root
@@ -19,8 +27,9 @@ class StandardTrie:
 
         for byte in sequence:
             if byte not in current_node.children:
+                if not new_entry and self.added is not None:
+                    self._record(current_node, byte)
                 current_node.children[byte] = StandardTrieNode()
-                self.memory_usage += sys.getsizeof(current_node.children[byte])
                 new_entry = True  # A new node indicates we are adding a new substring
 
             current_node = current_node.children[byte]
@@ -38,13 +47,44 @@ class StandardTrie:
             current_node = current_node.children[byte]
         return current_node.index
 
+    # Cursor API: lets callers walk the trie one byte at a time from a node
+    # they already hold instead of re-searching from the root every time.
+    def root_cursor(self):
+        return self.root
+
+    def step(self, cursor, byte):
+        # Returns the cursor one byte further down, or None if there is no such child
+        return cursor.children.get(byte)
+
+    def cursor_index(self, cursor):
+        return cursor.index
+
+    def insert_at(self, cursor, byte, index):
+        # Adds a single-byte child under the cursor (the cursor must not already have it)
+        new_node = StandardTrieNode()
+        new_node.index = index
+        cursor.children[byte] = new_node
+        self.dictionary_size += 1
+        if self.added is not None:
+            self._record(cursor, byte)
+        return new_node
+
+    def _record(self, node, byte):
+        self.added.append((node, byte))
+        if len(self.added) > self.added_limit:
+            # Undoing this many additions would cost more than copying the snapshot again
+            self.added = None
+
     def remove(self, sequence):
+        # Sequences of a restored snapshot must stay (LZW never evicts them):
+        # reset() only undoes additions
         # Helper function to recursively remove nodes
         def _remove(node, sequence, depth):
             if depth == len(sequence):
                 # Reached the end of the sequence
                 if node.index is not None:
                     node.index = None  # Remove the index
+                    self.dictionary_size -= 1
                     return len(node.children) == 0  # If no children, indicate this node can be deleted
                 return False
 
@@ -60,7 +100,6 @@ class StandardTrie:
             # If the child node should be deleted, remove it from the children dictionary
             if should_delete_child:
                 del node.children[byte]
-                self.memory_usage -= sys.getsizeof(child_node)
 
                 # Return true if this node also has no index and no other children
                 return len(node.children) == 0 and node.index is None
@@ -70,11 +109,66 @@ class StandardTrie:
         # Start removal from the root node
         _remove(self.root, sequence, 0)
 
+    def reset(self):
+        # Back to the snapshot last given to restore(), undoing only the nodes
+        # added since, so the cost follows the number of sequences added rather
+        # than the size of the snapshot
+        if self.base is not None:
+            if self.added is None:
+                self.restore(self.base)
+                return
+            for node, byte in self.added:
+                node.children.pop(byte, None)
+            self.added.clear()
+            self.dictionary_size = self.base.dictionary_size
+            return
+
+        # Otherwise drop every sequence longer than one byte. The single-byte nodes
+        # stay in place (with their indices) so they do not have to be rebuilt.
+        single_byte_nodes = self.root.children.values()
+        for node in single_byte_nodes:
+            node.children.clear()
+        self.dictionary_size = sum(1 for node in single_byte_nodes if node.index is not None)
+        if self.root.index is not None:
+            self.dictionary_size += 1
+
+    def snapshot(self):
+        # A copy of the trie in its current state, for restore()
+        snapshot = StandardTrie()
+        snapshot.restore(self)
+        snapshot.base = snapshot.added = None
+        return snapshot
+
+    def restore(self, snapshot):
+        # Make this trie a copy of snapshot (another StandardTrie), node by node
+        # rather than by inserting every sequence again, and make it the state
+        # reset() returns to. The root node stays the same object, so cursors on
+        # it remain valid.
+        node_count = 0
+        stack = [(snapshot.root, self.root)]
+        while stack:
+            source, target = stack.pop()
+            target.index = source.index
+            children = target.children = {}
+            for byte, child in source.children.items():
+                copy = children[byte] = StandardTrieNode()
+                stack.append((child, copy))
+            node_count += 1
+        self.dictionary_size = snapshot.dictionary_size
+        self.base = snapshot
+        self.added = []
+        self.added_limit = node_count
+
     def get_dictionary_size(self):
         return self.dictionary_size
 
     def get_memory_usage(self):
-        return self.memory_usage
+        # Deep size of every node with its children dict and index, measured on demand
+        return deep_sizeof(self.root)
+
+    @property
+    def memory_usage(self):
+        return self.get_memory_usage()
 
     def visualize_trie(self):
         # Helper function to visualize the trie structure recursively, showing full strings